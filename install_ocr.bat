@@ -13,7 +13,7 @@ set /p choice=请输入选项 (1 或 2):
 if "%choice%"=="1" (
     echo.
     echo 正在安装 PaddleOCR...
-    pip install paddleocr paddlepaddle
+    pip install paddleocr paddlepaddle psutil
     if %errorlevel% == 0 (
         echo.
         echo PaddleOCR 安装成功！
@@ -25,7 +25,7 @@ if "%choice%"=="1" (
 ) else if "%choice%"=="2" (
     echo.
     echo 正在安装 Tesseract OCR Python库...
-    pip install pytesseract pillow
+    pip install pytesseract pillow psutil
     if %errorlevel% == 0 (
         echo.
         echo Python库安装成功！
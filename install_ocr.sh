@@ -12,7 +12,7 @@ read -p "请输入选项 (1 或 2): " choice
 if [ "$choice" == "1" ]; then
     echo ""
     echo "正在安装 PaddleOCR..."
-    pip3 install paddleocr paddlepaddle
+    pip3 install paddleocr paddlepaddle psutil
     if [ $? -eq 0 ]; then
         echo ""
         echo "PaddleOCR 安装成功！"
@@ -24,7 +24,7 @@ if [ "$choice" == "1" ]; then
 elif [ "$choice" == "2" ]; then
     echo ""
     echo "正在安装 Tesseract OCR Python库..."
-    pip3 install pytesseract pillow
+    pip3 install pytesseract pillow psutil
     if [ $? -eq 0 ]; then
         echo ""
         echo "Python库安装成功！"
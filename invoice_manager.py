@@ -9,9 +9,30 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import sqlite3
 from datetime import datetime
+import argparse
+import atexit
+import base64
+import concurrent.futures
+import ctypes
+import ctypes.util
 import json
+import gzip
+import hashlib
+import heapq
+import io
+import mmap
+import multiprocessing
 import os
+import queue
 import re
+import select
+import shutil
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zlib
 
 # OCR相关导入（可选，如果未安装则禁用OCR功能）
 OCR_AVAILABLE = False
@@ -31,12 +52,88 @@ except ImportError:
         OCR_AVAILABLE = False
         USE_PADDLEOCR = False
 
+# 图片处理（可选，用于生成发票原件缩略图）
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# PDF 渲染（可选，用于生成 PDF 原件首页缩略图）
+try:
+    import pymupdf
+    PDF_PREVIEW_AVAILABLE = True
+except ImportError:
+    try:
+        # 1.24.3 之前的 PyMuPDF 只提供 fitz 模块名
+        import fitz as pymupdf
+        PDF_PREVIEW_AVAILABLE = True
+    except ImportError:
+        PDF_PREVIEW_AVAILABLE = False
+
+# ONNX Runtime CPU 推理（可选，用于 OCR 的 onnx 推理模式）
+try:
+    import onnxruntime as ort
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
+# 进程内存监控（可选，未安装时在 Linux 上读取 /proc，Windows 上无法监控）
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+# 统计分析相关导入（可选，如果未安装则禁用统计分析功能）
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
 
 class InvoiceDatabase:
-    """发票数据库管理类"""
+    """发票数据库管理类
     
-    def __init__(self, db_path='invoices.db'):
+    当前年度的发票保存在热库（invoices.db）中；已结账年度按年拆分到
+    归档目录下的独立文件（invoices_YYYY.db），查询时按需 ATTACH 并汇总。
+    新增、删除由后台写入线程合并为组提交，调用方通过 Future 获取各自结果。
+    """
+    
+    # 发票表的数据列（不含 id 与 created_at）
+    INVOICE_COLUMNS = (
+        'invoice_number', 'invoice_date', 'buyer_name', 'buyer_tax_id',
+        'seller_name', 'seller_tax_id', 'amount', 'tax_amount',
+        'total_amount', 'invoice_type', 'status', 'notes'
+    )
+    # 新增发票的必填字段（写入时直接取值）
+    REQUIRED_FIELDS = ('invoice_number', 'invoice_date', 'amount', 'total_amount')
+    # 单次同时挂载的归档库数量（SQLite 默认上限为10）
+    MAX_ATTACHED = 8
+    # 新年度开始后，超过该天数才自动归档上一年度（留出补录时间）
+    ARCHIVE_GRACE_DAYS = 31
+    # 随发票一起归档、删除的附属表（以 invoice_id 关联）
+    SIDE_TABLES = ('ocr_results', 'attachments')
+    # 附件存入后在该秒数内不会被清理（存入与提交之间，文件尚未被数据库引用）
+    ATTACHMENT_GRACE = 3600
+    # 组提交：每批最多写入条数
+    GROUP_COMMIT_SIZE = 256
+    
+    def __init__(self, db_path='invoices.db', archive_dir=None):
         self.db_path = db_path
+        self.archive_dir = archive_dir or os.path.join(
+            os.path.dirname(os.path.abspath(db_path)), 'archive'
+        )
+        self._archive_stats_cache = {}
+        self.attachments = AttachmentStore(os.path.join(
+            os.path.dirname(os.path.abspath(db_path)), 'attachments'
+        ))
+        # 所有写入由单个后台线程执行
+        self._write_queue = queue.Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._closed = False
         self.init_database()
     
     def init_database(self):
@@ -44,8 +141,17 @@ class InvoiceDatabase:
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS invoices (
+        # WAL 模式下读操作（查询、在线备份）不会阻塞写入
+        cursor.execute('PRAGMA journal_mode=WAL')
+        self._create_tables(cursor)
+        
+        conn.commit()
+        conn.close()
+    
+    def _create_tables(self, cursor, schema='main'):
+        """在指定库（热库或已挂载的归档库）中创建数据表"""
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {schema}.invoices (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 invoice_number TEXT NOT NULL UNIQUE,
                 invoice_date TEXT NOT NULL,
@@ -63,14 +169,257 @@ class InvoiceDatabase:
             )
         ''')
         
-        conn.commit()
-        conn.close()
+        # OCR 结构化结果（压缩存储），用于改进解析规则后重新解析
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {schema}.ocr_results (
+                invoice_id INTEGER PRIMARY KEY,
+                backend TEXT,
+                version TEXT,
+                data BLOB NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 发票原件：文件按内容哈希存放在附件目录，表中只保存引用
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {schema}.attachments (
+                invoice_id INTEGER PRIMARY KEY,
+                file_hash TEXT NOT NULL,
+                ext TEXT,
+                filename TEXT,
+                size INTEGER,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_attachments_hash ON attachments (file_hash)')
     
-    def add_invoice(self, invoice_data):
-        """添加发票"""
-        conn = sqlite3.connect(self.db_path)
+    @staticmethod
+    def _has_table(cursor, schema, table):
+        """检查库中是否存在指定表（早期创建的归档库可能没有新表）"""
+        cursor.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        return cursor.fetchone() is not None
+    
+    def archive_path(self, year):
+        """归档库文件路径"""
+        return os.path.join(self.archive_dir, f'invoices_{year}.db')
+    
+    def get_archive_years(self):
+        """获取已归档的年份列表"""
+        if not os.path.isdir(self.archive_dir):
+            return []
+        
+        years = []
+        for name in os.listdir(self.archive_dir):
+            match = re.match(r'^invoices_(\d{4})\.db$', name)
+            if match:
+                years.append(int(match.group(1)))
+        return sorted(years)
+    
+    def _each_partition(self, cursor, include_hot=True, years=None):
+        """依次挂载各分区，逐个产出库名（main 或 archive_YYYY）
+        
+        归档库分批 ATTACH，每批处理完后提交并 DETACH，避免超出挂载上限。
+        """
+        if include_hot:
+            yield 'main'
+        
+        if years is None:
+            years = self.get_archive_years()
+        
+        for start in range(0, len(years), self.MAX_ATTACHED):
+            chunk = years[start:start + self.MAX_ATTACHED]
+            for year in chunk:
+                cursor.execute(f'ATTACH DATABASE ? AS archive_{int(year)}', (self.archive_path(year),))
+            for year in chunk:
+                yield f'archive_{int(year)}'
+            cursor.connection.commit()
+            for year in chunk:
+                cursor.execute(f'DETACH DATABASE archive_{int(year)}')
+    
+    def _start_writer(self):
+        """启动后台写入线程（首次写入时调用）"""
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._writer_loop, name='invoice-db-writer', daemon=True)
+                self._writer.start()
+                # 进程退出前确保队列中的写入全部落盘
+                atexit.register(self.close)
+    
+    def _submit(self, kind, *args):
+        """提交写入请求，返回 Future"""
+        if self._closed:
+            raise RuntimeError('数据库已关闭')
+        if self._writer is None:
+            self._start_writer()
+        future = concurrent.futures.Future()
+        self._write_queue.put((future, kind, args))
+        return future
+    
+    def add_invoice_async(self, invoice_data, ocr_result=None, source_path=None):
+        """异步添加发票，返回 Future；结果为 True 表示成功，False 表示发票号码已存在
+        
+        source_path 为发票原件（图片或PDF），提交前先存入附件目录。
+        缺少必填字段时在调用方线程抛出 KeyError。
+        """
+        missing = [field for field in self.REQUIRED_FIELDS if field not in invoice_data]
+        if missing:
+            raise KeyError(f"缺少字段: {', '.join(missing)}")
+        attachment = None
+        if source_path:
+            file_hash, ext, size = self.attachments.put(source_path)
+            attachment = {'file_hash': file_hash, 'ext': ext, 'size': size,
+                          'filename': os.path.basename(source_path)}
+        return self._submit('add', invoice_data, ocr_result, attachment)
+    
+    def delete_invoice_async(self, invoice_id):
+        """异步删除发票，返回 Future"""
+        return self._submit('delete', invoice_id)
+    
+    def add_invoice(self, invoice_data, ocr_result=None, source_path=None):
+        """添加发票，可同时保存 OCR 结构化结果和发票原件"""
+        return self.add_invoice_async(invoice_data, ocr_result, source_path).result()
+    
+    def delete_invoice(self, invoice_id):
+        """删除发票"""
+        self.delete_invoice_async(invoice_id).result()
+    
+    def flush(self):
+        """等待已提交的写入全部完成"""
+        if self._writer is not None and not self._closed:
+            self._submit('flush').result()
+    
+    def close(self):
+        """处理完队列中剩余的写入后停止写入线程"""
+        with self._writer_lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._writer is not None:
+            self._write_queue.put(None)
+            self._writer.join()
+    
+    def _writer_loop(self):
+        """写入线程：把队列中的请求合并为一个事务提交（组提交）"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
         cursor = conn.cursor()
         
+        stopping = False
+        while not stopping:
+            item = self._write_queue.get()
+            if item is None:
+                break
+            
+            # 收集一批请求：取出队列中已有的请求，队列空即提交，不额外等待。
+            # 上一批提交（fsync）期间到达的请求自然组成下一批
+            batch = [item]
+            while len(batch) < self.GROUP_COMMIT_SIZE:
+                try:
+                    item = self._write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            
+            try:
+                self._commit_batch(cursor, batch)
+            except Exception as e:
+                # 意外异常只让本批失败，写入线程继续处理后续请求
+                for future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self._reset_connection(cursor)
+        
+        conn.close()
+    
+    @staticmethod
+    def _reset_connection(cursor):
+        """回滚未完成的事务并卸载残留的归档库，使写入连接恢复可用"""
+        try:
+            if cursor.connection.in_transaction:
+                cursor.execute('ROLLBACK')
+            cursor.execute('PRAGMA database_list')
+            for name in [row[1] for row in cursor.fetchall() if row[1].startswith('archive_')]:
+                cursor.execute(f'DETACH DATABASE {name}')
+        except sqlite3.Error as e:
+            print(f"写入连接重置失败: {e}")
+    
+    def _commit_batch(self, cursor, batch):
+        """在一个事务中执行一批写入，每项使用独立的保存点，互不影响"""
+        batch = [(future, kind, args) for future, kind, args in batch if future.set_running_or_notify_cancel()]
+        
+        # 归档库的唯一性检查需要 ATTACH，只能在事务外进行，整批一次完成
+        numbers = [args[0]['invoice_number'] for _, kind, args in batch if kind == 'add']
+        try:
+            archived = self._archived_numbers(cursor, numbers) if numbers else set()
+        except Exception as e:
+            for future, _, _ in batch:
+                future.set_exception(e)
+            return
+        
+        results = []
+        # 可能不再被引用的附件，提交后检查并清理
+        released = []
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for future, kind, args in batch:
+                cursor.execute('SAVEPOINT item')
+                try:
+                    if kind == 'add':
+                        result = args[0]['invoice_number'] not in archived and self._write_add(cursor, *args)
+                        if not result and args[2]:
+                            released.append((args[2]['file_hash'], args[2]['ext']))
+                    elif kind == 'delete':
+                        result = self._write_delete(cursor, args[0], released)
+                    else:
+                        result = None
+                    cursor.execute('RELEASE item')
+                    results.append((future, kind, args, result, None))
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO item')
+                    cursor.execute('RELEASE item')
+                    results.append((future, kind, args, None, e))
+            cursor.execute('COMMIT')
+        except Exception as e:
+            if cursor.connection.in_transaction:
+                cursor.execute('ROLLBACK')
+            for future, _, _ in batch:
+                future.set_exception(e)
+            return
+        
+        # 事务提交（已落盘）后才通知调用方
+        for future, kind, args, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+                continue
+            if kind == 'delete' and not result:
+                # 热库中不存在时，可能是归档年度的发票
+                try:
+                    self._delete_from_archive(cursor, args[0], released)
+                except Exception as e:
+                    future.set_exception(e)
+                    continue
+            future.set_result(result if kind == 'add' else None)
+        
+        if released:
+            try:
+                self._release_attachments(cursor, released)
+            except (OSError, sqlite3.Error) as e:
+                print(f"附件清理失败: {e}")
+    
+    def _archived_numbers(self, cursor, numbers, include_hot=False):
+        """返回 numbers 中已存在于归档库（include_hot 时含热库）的发票号码"""
+        found = set()
+        placeholders = ', '.join('?' * len(numbers))
+        for schema in self._each_partition(cursor, include_hot=include_hot):
+            cursor.execute(f'SELECT invoice_number FROM {schema}.invoices WHERE invoice_number IN ({placeholders})',
+                           numbers)
+            found.update(row[0] for row in cursor.fetchall())
+        return found
+    
+    def _write_add(self, cursor, invoice_data, ocr_result, attachment=None):
+        """写入一张发票（在写入线程的事务中执行）"""
         try:
             cursor.execute('''
                 INSERT INTO invoices (
@@ -92,110 +441,1318 @@ class InvoiceDatabase:
                 invoice_data.get('status', '正常'),
                 invoice_data.get('notes', '')
             ))
-            conn.commit()
-            return True
         except sqlite3.IntegrityError:
             return False
-        finally:
-            conn.close()
+        
+        invoice_id = cursor.lastrowid
+        if ocr_result:
+            cursor.execute(
+                'INSERT INTO ocr_results (invoice_id, backend, version, data) VALUES (?, ?, ?, ?)',
+                (invoice_id, ocr_result.get('backend'), ocr_result.get('version'),
+                 InvoiceOCR.pack_result(ocr_result))
+            )
+        if attachment:
+            cursor.execute(
+                'INSERT INTO attachments (invoice_id, file_hash, ext, filename, size) VALUES (?, ?, ?, ?, ?)',
+                (invoice_id, attachment['file_hash'], attachment['ext'], attachment['filename'], attachment['size'])
+            )
+        return True
+    
+    def _write_delete(self, cursor, invoice_id, released):
+        """从热库删除发票（在写入线程的事务中执行），返回是否删除"""
+        cursor.execute('DELETE FROM invoices WHERE id = ?', (invoice_id,))
+        deleted = cursor.rowcount
+        self._delete_side_rows(cursor, 'main', invoice_id, released)
+        return deleted > 0
+    
+    def _delete_from_archive(self, cursor, invoice_id, released):
+        """从归档库删除发票"""
+        for schema in self._each_partition(cursor, include_hot=False):
+            cursor.execute(f'DELETE FROM {schema}.invoices WHERE id = ?', (invoice_id,))
+            if cursor.rowcount:
+                self._archive_stats_cache.pop(schema, None)
+            self._delete_side_rows(cursor, schema, invoice_id, released)
+    
+    def _delete_side_rows(self, cursor, schema, invoice_id, released):
+        """删除发票的附属记录，被引用的附件加入 released"""
+        if self._has_table(cursor, schema, 'attachments'):
+            cursor.execute(f'SELECT file_hash, ext FROM {schema}.attachments WHERE invoice_id = ?', (invoice_id,))
+            released.extend(cursor.fetchall())
+        for table in self.SIDE_TABLES:
+            if self._has_table(cursor, schema, table):
+                cursor.execute(f'DELETE FROM {schema}.{table} WHERE invoice_id = ?', (invoice_id,))
+    
+    def _release_attachments(self, cursor, released):
+        """删除不再被任何发票引用的附件文件"""
+        remaining = {file_hash: ext for file_hash, ext in released}
+        # 写入线程的连接是长期复用的，需遍历完所有分区以确保归档库被 DETACH
+        for schema in self._each_partition(cursor):
+            if not remaining or not self._has_table(cursor, schema, 'attachments'):
+                continue
+            placeholders = ', '.join('?' * len(remaining))
+            cursor.execute(f'SELECT DISTINCT file_hash FROM {schema}.attachments WHERE file_hash IN ({placeholders})',
+                           list(remaining))
+            for (file_hash,) in cursor.fetchall():
+                remaining.pop(file_hash, None)
+        
+        # 刚存入的文件可能属于尚未提交的新增，留给 collect_attachment_garbage 处理
+        for file_hash, ext in remaining.items():
+            self.attachments.remove_unused(file_hash, ext, self.ATTACHMENT_GRACE)
     
-    def get_all_invoices(self):
-        """获取所有发票"""
+    def get_attachment(self, invoice_id):
+        """获取发票原件信息（含归档年度），没有时返回 None"""
         conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM invoices ORDER BY invoice_date DESC')
-        results = cursor.fetchall()
+        
+        result = None
+        for schema in self._each_partition(cursor):
+            if not self._has_table(cursor, schema, 'attachments'):
+                continue
+            cursor.execute(f'SELECT * FROM {schema}.attachments WHERE invoice_id = ?', (invoice_id,))
+            row = cursor.fetchone()
+            if row:
+                result = dict(row)
+                break
+        
         conn.close()
-        return results
+        return result
     
-    def search_invoices(self, keyword):
-        """搜索发票"""
+    def collect_attachment_garbage(self, min_age=None):
+        """清理附件目录中未被任何发票引用的文件，返回删除的文件数
+        
+        修改时间在 min_age 秒（默认 ATTACHMENT_GRACE）内的文件可能属于尚未提交的写入，暂不清理。
+        """
+        if min_age is None:
+            min_age = self.ATTACHMENT_GRACE
+        self.flush()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM invoices 
-            WHERE invoice_number LIKE ? OR buyer_name LIKE ? 
-            OR seller_name LIKE ? OR notes LIKE ?
-            ORDER BY invoice_date DESC
-        ''', (f'%{keyword}%', f'%{keyword}%', f'%{keyword}%', f'%{keyword}%'))
-        results = cursor.fetchall()
+        referenced = set()
+        for schema in self._each_partition(cursor):
+            if self._has_table(cursor, schema, 'attachments'):
+                cursor.execute(f'SELECT DISTINCT file_hash FROM {schema}.attachments')
+                referenced.update(row[0] for row in cursor.fetchall())
         conn.close()
-        return results
+        
+        removed = 0
+        for file_hash, ext, path in self.attachments.iter_files():
+            if file_hash not in referenced and self.attachments.remove_unused(file_hash, ext, min_age):
+                removed += 1
+        return removed
     
-    def delete_invoice(self, invoice_id):
-        """删除发票"""
+    def get_all_invoices(self, include_archive=False):
+        """获取所有发票（默认只读取热库，include_archive=True 时包含归档年度）"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        cursor.execute('DELETE FROM invoices WHERE id = ?', (invoice_id,))
-        conn.commit()
+        
+        partitions = []
+        for schema in self._each_partition(cursor, years=None if include_archive else []):
+            cursor.execute(f'SELECT * FROM {schema}.invoices ORDER BY invoice_date DESC')
+            partitions.append(cursor.fetchall())
+        
+        conn.close()
+        return self._merge_by_date(partitions)
+    
+    def get_invoice(self, invoice_id):
+        """按 id 获取单张发票（含归档年度）"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        result = None
+        for schema in self._each_partition(cursor):
+            cursor.execute(f'SELECT * FROM {schema}.invoices WHERE id = ?', (invoice_id,))
+            result = cursor.fetchone()
+            if result:
+                break
+        
+        conn.close()
+        return result
+    
+    def search_invoices(self, keyword):
+        """搜索发票（含归档年度）"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        partitions = []
+        for schema in self._each_partition(cursor):
+            cursor.execute(f'''
+                SELECT * FROM {schema}.invoices 
+                WHERE invoice_number LIKE ? OR buyer_name LIKE ? 
+                OR seller_name LIKE ? OR notes LIKE ?
+                ORDER BY invoice_date DESC
+            ''', (f'%{keyword}%', f'%{keyword}%', f'%{keyword}%', f'%{keyword}%'))
+            partitions.append(cursor.fetchall())
+        
         conn.close()
+        return self._merge_by_date(partitions)
+    
+    @staticmethod
+    def _merge_by_date(partitions):
+        """合并各分区已按开票日期倒序排列的结果"""
+        if len(partitions) == 1:
+            return partitions[0]
+        return list(heapq.merge(*partitions, key=lambda row: row[2], reverse=True))
     
     def get_statistics(self):
-        """获取统计信息"""
+        """获取统计信息（含归档年度）"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('SELECT COUNT(*), SUM(total_amount), SUM(tax_amount) FROM invoices')
-        stats = cursor.fetchone()
+        count, total_amount, total_tax = cursor.fetchone()
+        count, total_amount, total_tax = count or 0, total_amount or 0, total_tax or 0
+        
+        # 归档库只在结转时变化，按文件修改时间缓存其统计结果
+        years = self.get_archive_years()
+        pending = []
+        for year in years:
+            cached = self._archive_stats_cache.get(f'archive_{year}')
+            if cached and cached[0] == os.path.getmtime(self.archive_path(year)):
+                count += cached[1][0]
+                total_amount += cached[1][1]
+                total_tax += cached[1][2]
+            else:
+                pending.append(year)
+        
+        for schema in self._each_partition(cursor, include_hot=False, years=pending):
+            cursor.execute(f'SELECT COUNT(*), SUM(total_amount), SUM(tax_amount) FROM {schema}.invoices')
+            stats = cursor.fetchone()
+            stats = (stats[0] or 0, stats[1] or 0, stats[2] or 0)
+            year = int(schema.split('_')[1])
+            self._archive_stats_cache[schema] = (os.path.getmtime(self.archive_path(year)), stats)
+            count += stats[0]
+            total_amount += stats[1]
+            total_tax += stats[2]
+        
+        conn.close()
+        return {
+            'total_count': count,
+            'total_amount': total_amount,
+            'total_tax': total_tax
+        }
+    
+    # 重新解析时比较和更新的字段
+    REPARSE_FIELDS = (
+        'invoice_number', 'invoice_date', 'buyer_name', 'buyer_tax_id',
+        'seller_name', 'seller_tax_id', 'amount', 'tax_amount', 'total_amount'
+    )
+    
+    def reparse_ocr_results(self, parser):
+        """用当前解析规则重新解析已保存的 OCR 结果（不重新识别图片），只生成预览
+        
+        录入时的解析结果保存在 OCR 结果的 'parsed' 中；字段当前值与其不同说明已被人工修改，
+        不会被覆盖。返回有变化的发票列表
+        [{'id', 'schema', 'invoice_number', 'changes': {字段: (当前值, 新值)}, 'kept': {...}, 'legacy'}]，
+        'changes' 为可以应用的修改，'kept' 为因人工修改（或缺少原始解析结果，即 legacy）而保留的字段。
+        """
+        columns = ', '.join(f'i.{field}' for field in self.REPARSE_FIELDS)
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        report = []
+        for schema in self._each_partition(cursor):
+            if not self._has_table(cursor, schema, 'ocr_results'):
+                continue
+            cursor.execute(f'''
+                SELECT i.id, o.data, {columns} FROM {schema}.ocr_results o
+                JOIN {schema}.invoices i ON i.id = o.invoice_id
+            ''')
+            
+            for row in cursor.fetchall():
+                result = InvoiceOCR.unpack_result(row[1])
+                baseline = result.get('parsed')
+                info = parser.parse_invoice_layout(result)
+                changes, kept = {}, {}
+                for field, current in zip(self.REPARSE_FIELDS, row[2:]):
+                    new = info.get(field)
+                    if new is None or self._same_value(new, current):
+                        continue
+                    if baseline is not None and self._same_value(baseline.get(field), current):
+                        changes[field] = (current, new)
+                    else:
+                        kept[field] = (current, new)
+                if changes or kept:
+                    report.append({'id': row[0], 'schema': schema, 'invoice_number': row[2],
+                                   'changes': changes, 'kept': kept, 'legacy': baseline is None})
         
         conn.close()
+        return report
+    
+    @staticmethod
+    def _same_value(a, b):
+        """比较字段值：空值与空字符串视为相同，金额按分比较"""
+        if a in (None, '') or b in (None, ''):
+            return a in (None, '') and b in (None, '')
+        if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+            return round(a - b, 2) == 0
+        return a == b
+    
+    def apply_reparse(self, report):
+        """写回 reparse_ocr_results 预览中的修改（只写 'changes'，不重新解析），返回更新的发票数
+        
+        预览后发票又被修改、或新发票号码与任一年度的发票冲突时不更新，原因记录在条目的 'error' 中。
+        """
+        entries = [entry for entry in report if entry['changes']]
+        if not entries:
+            return 0
+        self.flush()
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        # 发票号码在所有年度中唯一，先检查新号码是否已被占用（含本批中的重复）
+        numbers = [entry['changes']['invoice_number'][1] for entry in entries if 'invoice_number' in entry['changes']]
+        taken = self._archived_numbers(cursor, numbers, include_hot=True) if numbers else set()
+        claimed = set()
+        for entry in entries:
+            if 'invoice_number' in entry['changes']:
+                number = entry['changes']['invoice_number'][1]
+                if number in taken or number in claimed:
+                    entry['error'] = f'发票号码 {number} 与已有发票冲突'
+                claimed.add(number)
+        
+        by_schema = {}
+        for entry in entries:
+            if 'error' not in entry:
+                by_schema.setdefault(entry['schema'], []).append(entry)
+        years = sorted(int(schema.split('_')[1]) for schema in by_schema if schema != 'main')
+        
+        updated = 0
+        for schema in self._each_partition(cursor, include_hot='main' in by_schema, years=years):
+            for entry in by_schema[schema]:
+                changes = entry['changes']
+                assignments = ', '.join(f'{field} = ?' for field in changes)
+                # 只在字段仍为预览时的值时更新
+                conditions = ' AND '.join(f'{field} IS ?' for field in changes)
+                try:
+                    cursor.execute(
+                        f'UPDATE {schema}.invoices SET {assignments} WHERE id = ? AND {conditions}',
+                        [new for _, new in changes.values()] + [entry['id']] + [old for old, _ in changes.values()]
+                    )
+                except sqlite3.IntegrityError:
+                    entry['error'] = '发票号码与已有发票冲突'
+                    continue
+                if not cursor.rowcount:
+                    entry['error'] = '发票在预览后已被修改'
+                    continue
+                
+                # 应用的字段成为新的解析基准，下次重新解析时不会被视为人工修改
+                cursor.execute(f'SELECT data FROM {schema}.ocr_results WHERE invoice_id = ?', (entry['id'],))
+                result = InvoiceOCR.unpack_result(cursor.fetchone()[0])
+                result['parsed'].update({field: new for field, (_, new) in changes.items()})
+                cursor.execute(f'UPDATE {schema}.ocr_results SET data = ? WHERE invoice_id = ?',
+                               (InvoiceOCR.pack_result(result), entry['id']))
+                updated += 1
+            self._archive_stats_cache.pop(schema, None)
+        
+        conn.commit()
+        conn.close()
+        return updated
+    
+    def archive_year(self, year):
+        """将指定年度的发票从热库移入归档库，返回移动的发票数"""
+        year = int(year)
+        self.flush()
+        os.makedirs(self.archive_dir, exist_ok=True)
+        columns = ', '.join(('id',) + self.INVOICE_COLUMNS + ('created_at',))
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(f'ATTACH DATABASE ? AS archive_{year}', (self.archive_path(year),))
+            self._create_tables(cursor, f'archive_{year}')
+            
+            # 先复制后删除，两步各自提交；中途中断后重新执行是幂等的
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO archive_{year}.invoices ({columns})
+                SELECT {columns} FROM main.invoices WHERE SUBSTR(invoice_date, 1, 4) = ?
+            ''', (str(year),))
+            for table in self.SIDE_TABLES:
+                cursor.execute(f'''
+                    INSERT OR IGNORE INTO archive_{year}.{table}
+                    SELECT * FROM main.{table} WHERE invoice_id IN (
+                        SELECT id FROM main.invoices WHERE SUBSTR(invoice_date, 1, 4) = ?
+                    )
+                ''', (str(year),))
+            conn.commit()
+            
+            # 只删除确已复制到归档库的发票：两步之间（其他进程）新增的发票，
+            # 以及因发票号码冲突未能复制的发票都留在热库
+            copied = f'''
+                SELECT i.id FROM main.invoices i JOIN archive_{year}.invoices a
+                ON a.id = i.id AND a.invoice_number = i.invoice_number
+            '''
+            for table in self.SIDE_TABLES:
+                cursor.execute(f'DELETE FROM main.{table} WHERE invoice_id IN ({copied})')
+            cursor.execute(f'DELETE FROM main.invoices WHERE id IN ({copied})')
+            moved = cursor.rowcount
+            conn.commit()
+            
+            cursor.execute(f'DETACH DATABASE archive_{year}')
+            if moved:
+                # 回收热库空间，保持热库文件小巧
+                cursor.execute('VACUUM')
+        finally:
+            conn.close()
+        
+        self._archive_stats_cache.pop(f'archive_{year}', None)
+        return moved
+    
+    def archive_closed_years(self, before_year=None):
+        """归档 before_year 之前的所有年度，返回 {年份: 发票数}
+        
+        未指定 before_year 时，新年度开始超过 ARCHIVE_GRACE_DAYS 天后归档上一年度。
+        """
+        if before_year is None:
+            today = datetime.now()
+            before_year = today.year
+            if today.timetuple().tm_yday <= self.ARCHIVE_GRACE_DAYS:
+                before_year -= 1
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT DISTINCT SUBSTR(invoice_date, 1, 4) FROM invoices WHERE invoice_date < ?',
+                       (f'{before_year:04d}',))
+        years = [int(row[0]) for row in cursor.fetchall() if row[0] and row[0].isdigit()]
+        conn.close()
+        
+        return {year: self.archive_year(year) for year in sorted(years)}
+
+
+class AttachmentStore:
+    """发票原件存储类
+    
+    文件按 SHA-256 内容哈希命名并分两级子目录存放（files/ab/cd/<哈希>.<扩展名>），
+    相同内容只保存一份；缩略图在首次查看时生成并缓存在 thumbs/ 下。
+    """
+    
+    THUMBNAIL_SIZE = (360, 480)
+    
+    def __init__(self, root):
+        self.root = root
+        # 存入（刷新修改时间）与按修改时间清理互斥，避免清理刚被再次引用的文件
+        self._lock = threading.Lock()
+    
+    def file_path(self, file_hash, ext):
+        """原件路径"""
+        return os.path.join(self.root, 'files', file_hash[:2], file_hash[2:4], file_hash + ext)
+    
+    def thumbnail_path(self, file_hash):
+        """缩略图缓存路径"""
+        return os.path.join(self.root, 'thumbs', file_hash[:2], file_hash + '.png')
+    
+    def put(self, source_path):
+        """存入文件，返回 (哈希, 扩展名, 大小)；内容已存在时不重复复制"""
+        digest = hashlib.sha256()
+        with open(source_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        file_hash = digest.hexdigest()
+        ext = os.path.splitext(source_path)[1].lower()
+        target = self.file_path(file_hash, ext)
+        
+        with self._lock:
+            try:
+                # 更新修改时间，避免被清理当作旧的孤立文件
+                os.utime(target)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                # 先写临时文件再改名，避免留下不完整的文件
+                partial = f'{target}.{os.getpid()}.{threading.get_ident()}.partial'
+                shutil.copyfile(source_path, partial)
+                os.replace(partial, target)
+            return file_hash, ext, os.path.getsize(target)
+    
+    @staticmethod
+    def _read(path):
+        """通过内存映射读取文件内容"""
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return mapped[:]
+    
+    def thumbnail(self, file_hash, ext):
+        """获取缩略图 PNG 数据（首次调用时生成并缓存），无法生成时返回 None"""
+        cached = self.thumbnail_path(file_hash)
+        if os.path.exists(cached):
+            return self._read(cached)
+        
+        source = self.file_path(file_hash, ext)
+        if not os.path.exists(source):
+            return None
+        
+        try:
+            if ext == '.pdf':
+                if not PDF_PREVIEW_AVAILABLE:
+                    return None
+                data = self._render_pdf(source)
+            else:
+                if not PIL_AVAILABLE:
+                    return None
+                data = self._render_image(source)
+        except (OSError, ValueError, RuntimeError, IndexError):
+            # 文件损坏或格式无法识别
+            return None
+        
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        partial = f'{cached}.{os.getpid()}.{threading.get_ident()}.partial'
+        with open(partial, 'wb') as f:
+            f.write(data)
+        os.replace(partial, cached)
+        return data
+    
+    def _render_image(self, source):
+        """生成图片缩略图（通过内存映射读取原件）"""
+        with open(source, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            image = Image.open(mapped)
+            image.thumbnail(self.THUMBNAIL_SIZE)
+            if image.mode not in ('RGB', 'RGBA', 'L'):
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, format='PNG')
+        return buffer.getvalue()
+    
+    def _render_pdf(self, source):
+        """将 PDF 首页渲染为缩略图"""
+        with pymupdf.open(source) as document:
+            page = document[0]
+            zoom = min(self.THUMBNAIL_SIZE[0] / page.rect.width, self.THUMBNAIL_SIZE[1] / page.rect.height)
+            pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+            return pixmap.tobytes('png')
+    
+    def remove(self, file_hash, ext):
+        """删除原件及其缩略图"""
+        for path in (self.file_path(file_hash, ext), self.thumbnail_path(file_hash)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    
+    def remove_unused(self, file_hash, ext, min_age):
+        """删除修改时间早于 min_age 秒前的原件，返回是否删除"""
+        with self._lock:
+            try:
+                if time.time() - os.path.getmtime(self.file_path(file_hash, ext)) < min_age:
+                    return False
+            except FileNotFoundError:
+                return False
+            self.remove(file_hash, ext)
+            return True
+    
+    def iter_files(self):
+        """遍历所有原件，产出 (哈希, 扩展名, 路径)"""
+        files_dir = os.path.join(self.root, 'files')
+        for dirpath, _, filenames in os.walk(files_dir):
+            for name in filenames:
+                if name.endswith('.partial'):
+                    continue
+                file_hash, ext = os.path.splitext(name)
+                yield file_hash, ext, os.path.join(dirpath, name)
+
+
+class InvoiceBackup:
+    """数据库在线备份类（基于 SQLite 在线备份 API）
+    
+    每次备份生成一个快照目录，包含热库、所有归档库及发票原件；备份按页分步复制，
+    步与步之间释放读锁，不会阻塞发票录入。
+    """
+    
+    # 每步复制的页数及步间休眠（秒）
+    PAGES_PER_STEP = 256
+    STEP_SLEEP = 0.005
+    # 源库在备份期间被修改会导致备份重新开始，超过该次数后改为一次性复制
+    MAX_RESTARTS = 3
+    # 定时备份设置文件（位于备份目录）及失败后的重试间隔（秒）
+    SCHEDULE_FILE = 'schedule.json'
+    RETRY_DELAY = 600
+    
+    def __init__(self, db, backup_dir=None):
+        self.db = db
+        self.backup_dir = backup_dir or os.path.join(
+            os.path.dirname(os.path.abspath(db.db_path)), 'backups'
+        )
+        self._schedule_stop = None
+        self._lock = threading.Lock()
+    
+    def backup(self, compress=False, verify=True, keep=None, progress=None):
+        """执行一次完整备份，返回备份结果
+        
+        progress(已复制页数, 总页数) 在每步完成后回调（在备份线程中调用）。
+        """
+        with self._lock:
+            start = time.perf_counter()
+            self._remove_partial()
+            name = 'snapshot_' + datetime.now().strftime('%Y%m%d_%H%M%S')
+            target_dir = os.path.join(self.backup_dir, name)
+            suffix = 1
+            while os.path.exists(target_dir):
+                suffix += 1
+                target_dir = os.path.join(self.backup_dir, f'{name}_{suffix}')
+            partial_dir = target_dir + '.partial'
+            os.makedirs(partial_dir, exist_ok=True)
+            
+            sources = [self.db.db_path] + [self.db.archive_path(year) for year in self.db.get_archive_years()]
+            files = []
+            total_bytes = 0
+            try:
+                for source in sources:
+                    target = os.path.join(partial_dir, os.path.basename(source))
+                    self._copy_database(source, target, progress)
+                    if verify and not self.verify(target):
+                        raise sqlite3.DatabaseError(f'备份文件完整性校验失败: {target}')
+                    total_bytes += os.path.getsize(target)
+                    if compress:
+                        target = self._compress(target)
+                    files.append(os.path.basename(target))
+                
+                # 原件在数据库之后复制：复制期间新增的原件最多多出几个文件，不会缺少
+                attachment_count = self._copy_attachments(partial_dir)
+                
+                # 全部完成后再改名，未完成的快照不会被当作有效备份
+                os.rename(partial_dir, target_dir)
+            except Exception:
+                shutil.rmtree(partial_dir, ignore_errors=True)
+                raise
+            
+            if keep:
+                self.prune(keep)
+            
+            seconds = time.perf_counter() - start
+            return {
+                'path': target_dir,
+                'files': files,
+                'bytes': total_bytes,
+                'attachments': attachment_count,
+                'seconds': seconds,
+                'mb_per_s': total_bytes / 1024 / 1024 / seconds if seconds > 0 else 0.0,
+                'verified': verify
+            }
+    
+    def _copy_database(self, source, target, progress=None):
+        """按页分步复制单个数据库"""
+        state = {'remaining': None, 'restarts': 0}
+        
+        def on_progress(status, remaining, total):
+            # 剩余页数回升说明源库被修改、备份已重新开始
+            if state['remaining'] is not None and remaining > state['remaining']:
+                state['restarts'] += 1
+                if state['restarts'] > self.MAX_RESTARTS:
+                    raise _BackupRestarted()
+            state['remaining'] = remaining
+            if progress:
+                progress(total - remaining, total)
+        
+        src = sqlite3.connect(source)
+        dst = sqlite3.connect(target)
+        try:
+            try:
+                src.backup(dst, pages=self.PAGES_PER_STEP, progress=on_progress, sleep=self.STEP_SLEEP)
+            except _BackupRestarted:
+                # 写入频繁时一次性复制；WAL 模式下只持有读快照，不阻塞写入
+                src.backup(dst, pages=-1)
+        finally:
+            dst.close()
+            src.close()
+    
+    def _copy_attachments(self, snapshot_dir):
+        """将附件目录中的原件放入快照的 attachments/files/，返回文件数
+        
+        原件按内容命名、存入后不会修改，优先硬链接（附件目录或上一个快照中的同一文件），
+        跨磁盘无法链接时才复制；缩略图可重新生成，不备份。
+        """
+        store = self.db.attachments
+        snapshots = self.list_snapshots()
+        previous = os.path.join(self.backup_dir, snapshots[-1]) if snapshots else None
+        
+        count = 0
+        for _, _, path in store.iter_files():
+            relative = os.path.relpath(path, store.root)
+            target = os.path.join(snapshot_dir, 'attachments', relative)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            sources = [path]
+            if previous:
+                sources.append(os.path.join(previous, 'attachments', relative))
+            try:
+                for source in sources:
+                    try:
+                        os.link(source, target)
+                        break
+                    except OSError:
+                        continue
+                else:
+                    shutil.copy2(path, target)
+            except FileNotFoundError:
+                # 复制期间被清理的无用原件
+                continue
+            count += 1
+        return count
+    
+    @staticmethod
+    def verify(path):
+        """校验备份文件完整性"""
+        conn = sqlite3.connect(path)
+        try:
+            result = conn.execute('PRAGMA integrity_check').fetchone()
+            return bool(result) and result[0] == 'ok'
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def _compress(path):
+        """gzip 压缩备份文件，返回压缩后的路径"""
+        compressed = path + '.gz'
+        with open(path, 'rb') as src, gzip.open(compressed, 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.remove(path)
+        return compressed
+    
+    def list_snapshots(self):
+        """列出已有快照（按时间从旧到新）"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self.backup_dir)
+            if name.startswith('snapshot_') and not name.endswith('.partial')
+        )
+    
+    def last_snapshot_time(self):
+        """最近一个快照的创建时间，没有快照时返回 None"""
+        for name in reversed(self.list_snapshots()):
+            try:
+                return datetime.strptime(name[len('snapshot_'):][:15], '%Y%m%d_%H%M%S')
+            except ValueError:
+                continue
+        return None
+    
+    def load_schedule(self):
+        """读取定时备份设置，没有设置时返回 None"""
+        try:
+            with open(os.path.join(self.backup_dir, self.SCHEDULE_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def save_schedule(self, enabled, interval_hours=24, keep=7, compress=True):
+        """保存定时备份设置，下次启动时恢复"""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        settings = {'enabled': enabled, 'interval_hours': interval_hours, 'keep': keep, 'compress': compress}
+        with open(os.path.join(self.backup_dir, self.SCHEDULE_FILE), 'w', encoding='utf-8') as f:
+            json.dump(settings, f, ensure_ascii=False, indent=2)
+    
+    def _seconds_until_due(self, interval_hours):
+        """距离下次定时备份的秒数，最近快照已超过间隔时为 0"""
+        last = self.last_snapshot_time()
+        if last is None:
+            return 0
+        return max(interval_hours * 3600 - (datetime.now() - last).total_seconds(), 0)
+    
+    def _remove_partial(self):
+        """删除上次异常退出时残留的未完成快照（调用方持有 self._lock）"""
+        if not os.path.isdir(self.backup_dir):
+            return
+        for name in os.listdir(self.backup_dir):
+            if name.startswith('snapshot_') and name.endswith('.partial'):
+                shutil.rmtree(os.path.join(self.backup_dir, name), ignore_errors=True)
+    
+    def prune(self, keep):
+        """只保留最近 keep 个快照"""
+        snapshots = self.list_snapshots()
+        for name in snapshots[:max(len(snapshots) - keep, 0)]:
+            shutil.rmtree(os.path.join(self.backup_dir, name), ignore_errors=True)
+    
+    def start(self, callback=None, **kwargs):
+        """在后台线程中执行备份，完成后以 callback(结果, 异常) 回调"""
+        def run():
+            try:
+                result = self.backup(**kwargs)
+            except Exception as e:
+                if callback:
+                    callback(None, e)
+            else:
+                if callback:
+                    callback(result, None)
+        
+        thread = threading.Thread(target=run, name='invoice-backup', daemon=True)
+        thread.start()
+        return thread
+    
+    def start_schedule(self, interval_hours=24, keep=7, compress=True, callback=None):
+        """启动定时备份
+        
+        以最近快照的时间计算下次备份时间，程序每天关闭也能按期备份：
+        启动时最近快照已超过间隔则立即备份。
+        """
+        self.stop_schedule()
+        stop = threading.Event()
+        self._schedule_stop = stop
+        
+        def run():
+            delay = self._seconds_until_due(interval_hours)
+            while not stop.wait(delay):
+                try:
+                    result = self.backup(compress=compress, keep=keep)
+                except Exception as e:
+                    delay = min(self.RETRY_DELAY, interval_hours * 3600)
+                    if callback:
+                        callback(None, e)
+                else:
+                    delay = self._seconds_until_due(interval_hours)
+                    if callback:
+                        callback(result, None)
+        
+        threading.Thread(target=run, name='invoice-backup-schedule', daemon=True).start()
+    
+    def stop_schedule(self):
+        """停止定时备份"""
+        if self._schedule_stop:
+            self._schedule_stop.set()
+            self._schedule_stop = None
+
+
+class _BackupRestarted(Exception):
+    """分步备份重启次数过多"""
+
+
+class InvoiceAnalytics:
+    """发票统计分析类（基于NumPy的内存列式快照）"""
+    
+    # 分组维度及显示名称
+    GROUP_KEYS = [
+        ('month', '月份'),
+        ('seller_name', '销售方'),
+        ('buyer_name', '购买方'),
+        ('tax_rate', '税率'),
+        ('status', '状态'),
+        ('invoice_type', '发票类型')
+    ]
+    # 字典编码的文本列
+    DICT_COLUMNS = ('buyer_name', 'seller_name', 'status', 'invoice_type')
+    # 每次从数据库读取的行数，避免一次性占用过多内存
+    FETCH_SIZE = 50000
+    # 手工录入的日期格式不统一：2026-2-3、2026/03/05、2026年3月5日、20260305
+    DATE_PATTERN = re.compile(r'^\s*(\d{4})\s*[-/.年]\s*(\d{1,2})\s*[-/.月]\s*(\d{1,2})|^\s*(\d{4})(\d{2})(\d{2})')
+    
+    def __init__(self, db):
+        self.db = db
+        self.reset()
+    
+    def reset(self):
+        """清空快照"""
+        self.size = 0
+        self.last_id = 0
+        # 快照中来自归档库的行数及归档文件签名
+        self.archive_size = 0
+        self.archive_signature = None
+        self.ids = np.empty(0, dtype=np.int64)
+        # 日期以整数 YYYYMMDD 存储
+        self.dates = np.empty(0, dtype=np.int32)
+        # 金额以“分”为单位的定点整数存储
+        self.amounts = np.empty(0, dtype=np.int64)
+        self.taxes = np.empty(0, dtype=np.int64)
+        self.totals = np.empty(0, dtype=np.int64)
+        self.codes = {col: np.empty(0, dtype=np.int32) for col in self.DICT_COLUMNS}
+        self.dictionaries = {col: [] for col in self.DICT_COLUMNS}
+        self._lookup = {col: {} for col in self.DICT_COLUMNS}
+        # 日期文本 -> YYYYMMDD，不同的日期文本远少于发票数
+        self._date_cache = {}
+    
+    @classmethod
+    def parse_date(cls, text):
+        """将日期文本转换为整数 YYYYMMDD，无法识别时返回 0"""
+        match = cls.DATE_PATTERN.match(text or '')
+        if not match:
+            return 0
+        year, month, day = (int(v) for v in (match.group(1, 2, 3) if match.group(1) else match.group(4, 5, 6)))
+        try:
+            datetime(year, month, day)
+        except ValueError:
+            return 0
+        return year * 10000 + month * 100 + day
+    
+    # 读取发票列并在 SQL 中完成金额的定点转换（日期格式不统一，在 Python 中解析）
+    SELECT_SQL = '''
+        SELECT id,
+               invoice_date,
+               CAST(ROUND(amount * 100) AS INTEGER),
+               CAST(ROUND(IFNULL(tax_amount, 0) * 100) AS INTEGER),
+               CAST(ROUND(total_amount * 100) AS INTEGER),
+               buyer_name, seller_name, status, invoice_type
+        FROM {schema}.invoices WHERE id > ? ORDER BY id
+    '''
+    
+    def refresh(self):
+        """增量刷新快照：只读取热库中 id 大于上次位置的新发票
+        
+        检测到删除或归档库发生变化（年度结转）时整体重建。
+        """
+        conn = sqlite3.connect(self.db.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            years = self.db.get_archive_years()
+            signature = [(year, os.path.getmtime(self.db.archive_path(year))) for year in years]
+            cursor.execute('SELECT COUNT(*) FROM invoices WHERE id <= ?', (self.last_id,))
+            if signature != self.archive_signature or cursor.fetchone()[0] != self.size - self.archive_size:
+                self.reset()
+                # 归档年度只在重建时整体加载一次
+                for schema in self.db._each_partition(cursor, include_hot=False, years=years):
+                    self._load(cursor, schema, 0)
+                self.archive_size = self.size
+                self.archive_signature = signature
+            
+            added = self._load(cursor, 'main', self.last_id)
+            if self.size > self.archive_size:
+                self.last_id = int(self.ids[self.size - 1])
+        finally:
+            conn.close()
+        
+        return added
+    
+    def _load(self, cursor, schema, after_id):
+        """分批读取指定库中 id 大于 after_id 的发票"""
+        cursor.execute(self.SELECT_SQL.format(schema=schema), (after_id,))
+        
+        added = 0
+        while True:
+            rows = cursor.fetchmany(self.FETCH_SIZE)
+            if not rows:
+                break
+            self._append(rows)
+            added += len(rows)
+        return added
+    
+    def _append(self, rows):
+        """将一批数据库行追加到列式数组"""
+        columns = list(zip(*rows))
+        count = len(rows)
+        self._reserve(self.size + count)
+        
+        end = self.size + count
+        self.ids[self.size:end] = columns[0]
+        date_cache = self._date_cache
+        dates = []
+        for text in columns[1]:
+            value = date_cache.get(text)
+            if value is None:
+                value = date_cache[text] = self.parse_date(text)
+            dates.append(value)
+        self.dates[self.size:end] = dates
+        self.amounts[self.size:end] = [v or 0 for v in columns[2]]
+        self.taxes[self.size:end] = [v or 0 for v in columns[3]]
+        self.totals[self.size:end] = [v or 0 for v in columns[4]]
+        
+        for col, values in zip(self.DICT_COLUMNS, columns[5:]):
+            lookup = self._lookup[col]
+            dictionary = self.dictionaries[col]
+            codes = []
+            for value in values:
+                value = value or ''
+                code = lookup.get(value)
+                if code is None:
+                    code = len(dictionary)
+                    lookup[value] = code
+                    dictionary.append(value)
+                codes.append(code)
+            self.codes[col][self.size:end] = codes
+        
+        self.size = end
+    
+    def _reserve(self, capacity):
+        """按倍数扩容数组，摊薄增量追加的复制开销"""
+        if capacity <= len(self.ids):
+            return
+        new_capacity = max(capacity, len(self.ids) * 2, 1024)
+        
+        def grow(array):
+            grown = np.empty(new_capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            return grown
+        
+        self.ids = grow(self.ids)
+        self.dates = grow(self.dates)
+        self.amounts = grow(self.amounts)
+        self.taxes = grow(self.taxes)
+        self.totals = grow(self.totals)
+        for col in self.DICT_COLUMNS:
+            self.codes[col] = grow(self.codes[col])
+    
+    def _filter_mask(self, date_from=None, date_to=None, status=None, seller_keyword=None):
+        """根据筛选条件生成布尔掩码，日期无法识别时抛出 ValueError"""
+        mask = np.ones(self.size, dtype=bool)
+        dates = self.dates[:self.size]
+        
+        for bound in (date_from, date_to):
+            if bound and not self.parse_date(bound):
+                raise ValueError(f'无法识别的日期: {bound}')
+        if date_from:
+            mask &= dates >= self.parse_date(date_from)
+        if date_to:
+            # 日期未知（0）的发票不属于任何日期范围
+            mask &= (dates > 0) & (dates <= self.parse_date(date_to))
+        if status:
+            code = self._lookup['status'].get(status, -1)
+            mask &= self.codes['status'][:self.size] == code
+        if seller_keyword:
+            matched = [code for code, name in enumerate(self.dictionaries['seller_name'])
+                       if seller_keyword in name]
+            mask &= np.isin(self.codes['seller_name'][:self.size], matched)
+        
+        return mask
+    
+    def summary(self, **filters):
+        """汇总统计（金额单位：元）"""
+        mask = self._filter_mask(**filters)
         return {
-            'total_count': stats[0] or 0,
-            'total_amount': stats[1] or 0,
-            'total_tax': stats[2] or 0
+            'total_count': int(mask.sum()),
+            'total_amount': int(self.totals[:self.size][mask].sum()) / 100,
+            'total_tax': int(self.taxes[:self.size][mask].sum()) / 100
         }
+    
+    def group_by(self, key, **filters):
+        """按维度分组聚合，返回 [{'key', 'count', 'amount', 'tax', 'total'}, ...]"""
+        mask = self._filter_mask(**filters)
+        amounts = self.amounts[:self.size][mask]
+        taxes = self.taxes[:self.size][mask]
+        totals = self.totals[:self.size][mask]
+        
+        if key == 'month':
+            values = self.dates[:self.size][mask] // 100
+            labels = lambda v: f'{v // 100:04d}-{v % 100:02d}' if v else '未知'
+        elif key == 'tax_rate':
+            # 税率按千分比取整，金额为0的记为 -1（未知）
+            safe_amounts = np.where(amounts != 0, amounts, 1)
+            values = np.where(amounts != 0, np.rint(taxes * 1000 / safe_amounts), -1).astype(np.int64)
+            labels = lambda v: f'{v / 10:g}%' if v >= 0 else '未知'
+        elif key in self.DICT_COLUMNS:
+            values = self.codes[key][:self.size][mask]
+            dictionary = self.dictionaries[key]
+            labels = lambda v: dictionary[v] or '(空)'
+        else:
+            raise ValueError(f'不支持的分组维度: {key}')
+        
+        groups, inverse = np.unique(values, return_inverse=True)
+        inverse = inverse.ravel()
+        counts = np.bincount(inverse, minlength=len(groups))
+        # 以分为单位的整数在 float64 中可精确表示（< 2^53）
+        amount_sums = np.rint(np.bincount(inverse, weights=amounts, minlength=len(groups))).astype(np.int64)
+        tax_sums = np.rint(np.bincount(inverse, weights=taxes, minlength=len(groups))).astype(np.int64)
+        total_sums = np.rint(np.bincount(inverse, weights=totals, minlength=len(groups))).astype(np.int64)
+        
+        results = []
+        for i, value in enumerate(groups.tolist()):
+            results.append({
+                'key': labels(value),
+                'count': int(counts[i]),
+                'amount': int(amount_sums[i]) / 100,
+                'tax': int(tax_sums[i]) / 100,
+                'total': int(total_sums[i]) / 100
+            })
+        
+        if key != 'month':
+            results.sort(key=lambda r: r['total'], reverse=True)
+        return results
 
 
 class InvoiceOCR:
     """发票OCR识别类"""
     
-    def __init__(self):
+    # 版面解析：按位置配对的标签
+    # (标签正则, 生成的“标签：值”前缀列表，按标签从上到下出现的顺序依次使用, 对应字段)
+    LAYOUT_LABELS = [
+        (r'发票号码', ['发票号码'], ['invoice_number']),
+        (r'开票日期', ['开票日期'], ['invoice_date']),
+        (r'名\s*称', ['购买方', '销售方'], ['buyer_name', 'seller_name']),
+        (r'纳税人识别号|统一社会信用代码', ['购买方税号', '销售方税号'], ['buyer_tax_id', 'seller_tax_id']),
+        (r'小\s*写', ['价税合计'], ['total_amount'])
+    ]
+    
+    # 推理配置（可在 ocr_config.json 中覆盖，见 ocr_config.example.json）
+    DEFAULT_CONFIG = {
+        # 'paddle'：Paddle Inference；'onnx'：ONNX Runtime（需先转换模型）
+        'engine': 'paddle',
+        # onnx 模式下的模型目录，包含 det.onnx、rec.onnx、cls.onnx（量化的识别模型为 rec_int8.onnx）
+        'model_dir': 'ocr_models',
+        'quantized': False,
+        # onnx 执行后端：'cpu' 或 'openvino'
+        'provider': 'cpu',
+        # onnx 模式算子内/算子间线程数（0 表示由 ONNX Runtime 按 CPU 核数决定）
+        'intra_op_threads': 0,
+        'inter_op_threads': 1,
+        # 以下为 None 时使用 PaddleOCR 默认值
+        'rec_batch_num': None,
+        'cpu_threads': None,
+        'enable_mkldnn': None
+    }
+    CONFIG_PATH = 'ocr_config.json'
+    # quantized 模式下使用 int8 模型的子模型（见 quantize_models）
+    QUANTIZED_MODELS = ('rec',)
+    
+    def __init__(self, load_engine=True, config=None):
         self.ocr = None
         self.use_paddle = False
-        if OCR_AVAILABLE:
+        self.config = dict(self.DEFAULT_CONFIG, **(self.load_config() if config is None else config))
+        # load_engine=False 时只使用文本解析功能，不加载识别模型
+        if OCR_AVAILABLE and load_engine:
             try:
                 if USE_PADDLEOCR:
                     # 使用PaddleOCR（中文识别效果更好）
-                    self.ocr = PaddleOCR(use_angle_cls=True, lang='ch')
+                    if self.config['engine'] == 'onnx':
+                        self.ocr = self._create_onnx_engine()
+                    else:
+                        self.ocr = PaddleOCR(use_angle_cls=True, lang='ch', **self._paddle_options())
                     self.use_paddle = True
                 else:
                     # 使用pytesseract
+                    self.ocr = pytesseract
                     self.use_paddle = False
             except Exception as e:
                 print(f"OCR初始化失败: {e}")
                 self.ocr = None
                 self.use_paddle = False
     
+    @classmethod
+    def load_config(cls, path=None):
+        """读取部署配置文件，不存在时返回空配置"""
+        path = path or cls.CONFIG_PATH
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"OCR配置文件读取失败: {e}")
+            return {}
+    
+    def _paddle_options(self):
+        """PaddleOCR 的可选推理参数"""
+        return {name: self.config[name] for name in ('rec_batch_num', 'cpu_threads', 'enable_mkldnn')
+                if self.config[name] is not None}
+    
+    def model_paths(self):
+        """onnx 模式下检测、识别、方向分类模型的路径"""
+        quantized = self.config['quantized']
+        return {name: os.path.join(self.config['model_dir'],
+                                   f'{name}_int8.onnx' if quantized and name in self.QUANTIZED_MODELS else f'{name}.onnx')
+                for name in ('det', 'rec', 'cls')}
+    
+    def _create_onnx_engine(self):
+        """创建 ONNX Runtime 推理的 PaddleOCR 实例
+        
+        沿用 PaddleOCR 的前后处理，只把三个模型的推理换成按配置创建的 ONNX Runtime 会话。
+        """
+        if not ONNXRUNTIME_AVAILABLE:
+            raise RuntimeError('onnx 推理模式需要安装 onnxruntime (pip install -r requirements-ocr-onnx.txt)')
+        
+        paths = self.model_paths()
+        for path in paths.values():
+            if not os.path.exists(path):
+                raise RuntimeError(f'找不到模型文件: {path}')
+        
+        options = dict(self._paddle_options(), rec_batch_num=self.config['rec_batch_num'] or 16)
+        options.pop('enable_mkldnn', None)
+        engine = PaddleOCR(use_angle_cls=True, lang='ch', use_onnx=True,
+                           det_model_dir=paths['det'], rec_model_dir=paths['rec'],
+                           cls_model_dir=paths['cls'], **options)
+        
+        # PaddleOCR 创建的会话未设置线程数和执行后端，按配置替换
+        session_options = ort.SessionOptions()
+        session_options.intra_op_num_threads = self.config['intra_op_threads']
+        session_options.inter_op_num_threads = self.config['inter_op_threads']
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        providers = ['CPUExecutionProvider']
+        if self.config['provider'] == 'openvino':
+            if 'OpenVINOExecutionProvider' not in ort.get_available_providers():
+                raise RuntimeError('当前 onnxruntime 不支持 OpenVINO，请安装 onnxruntime-openvino')
+            providers.insert(0, 'OpenVINOExecutionProvider')
+        
+        for attr, name in (('text_detector', 'det'), ('text_recognizer', 'rec'), ('text_classifier', 'cls')):
+            component = getattr(engine, attr, None)
+            if component is not None and hasattr(component, 'predictor'):
+                session = ort.InferenceSession(paths[name], sess_options=session_options, providers=providers)
+                component.predictor = session
+                component.input_tensor = session.get_inputs()[0]
+        return engine
+    
+    def threads_used(self):
+        """推理使用的 CPU 线程数（用于计算单核吞吐）"""
+        cores = os.cpu_count() or 1
+        if self.config['engine'] == 'onnx':
+            return self.config['intra_op_threads'] or cores
+        # Paddle Inference 默认使用 10 个线程
+        return min(self.config['cpu_threads'] or 10, cores)
+    
+    @staticmethod
+    def quantize_models(model_dir):
+        """将 model_dir 下的识别模型 rec.onnx 动态量化为 int8（rec_int8.onnx）
+        
+        只量化 MatMul/Gemm：检测、方向分类模型是卷积网络，动态量化会把 Conv 转为
+        ConvInteger，CPU 上支持有限且通常比 float32 更慢，因此保持 float32。
+        """
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        
+        outputs = []
+        for name in InvoiceOCR.QUANTIZED_MODELS:
+            source = os.path.join(model_dir, f'{name}.onnx')
+            target = os.path.join(model_dir, f'{name}_int8.onnx')
+            quantize_dynamic(source, target, weight_type=QuantType.QInt8, op_types_to_quantize=['MatMul', 'Gemm'])
+            outputs.append(target)
+        return outputs
+    
     def recognize_image(self, image_path):
         """识别图片中的文字"""
+        result = self.recognize_structured(image_path)
+        if result is None:
+            return None
+        return self.result_text(result)
+    
+    def recognize_structured(self, image_path):
+        """识别图片，返回带位置和置信度的结构化结果
+        
+        返回 {'backend', 'version', 'lines': [[文本, x0, y0, x1, y1, 置信度], ...]}，
+        行按从上到下、从左到右排列。
+        """
         if not OCR_AVAILABLE or not self.ocr:
             return None
         
         try:
+            lines = []
             if self.use_paddle:
                 # 使用PaddleOCR
                 result = self.ocr.ocr(image_path, cls=True)
-                # 提取所有文本
-                texts = []
                 if result and result[0]:
                     for line in result[0]:
                         if line and len(line) > 1:
-                            texts.append(line[1][0])
-                return '\n'.join(texts)
+                            xs = [point[0] for point in line[0]]
+                            ys = [point[1] for point in line[0]]
+                            lines.append([line[1][0], int(min(xs)), int(min(ys)), int(max(xs)), int(max(ys)),
+                                          round(float(line[1][1]), 3)])
+                backend, version = 'paddleocr', getattr(sys.modules.get('paddleocr'), '__version__', '')
+                if self.config['engine'] == 'onnx':
+                    version += '+onnx-int8' if self.config['quantized'] else '+onnx'
             else:
-                # 使用pytesseract
+                # 使用pytesseract，按行合并单词
                 image = Image.open(image_path)
-                text = pytesseract.image_to_string(image, lang='chi_sim+eng')
-                return text
+                data = pytesseract.image_to_data(image, lang='chi_sim+eng', output_type=pytesseract.Output.DICT)
+                grouped = {}
+                for i, word in enumerate(data['text']):
+                    if not word.strip():
+                        continue
+                    key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+                    x0, y0 = data['left'][i], data['top'][i]
+                    x1, y1 = x0 + data['width'][i], y0 + data['height'][i]
+                    conf = float(data['conf'][i])
+                    if key in grouped:
+                        line = grouped[key]
+                        line[0] += word if re.match(r'[\u4e00-\u9fff]', word) else ' ' + word
+                        line[1:5] = [min(line[1], x0), min(line[2], y0), max(line[3], x1), max(line[4], y1)]
+                        line[5].append(conf)
+                    else:
+                        grouped[key] = [word, x0, y0, x1, y1, [conf]]
+                for line in grouped.values():
+                    confs = [c for c in line[5] if c >= 0]
+                    line[5] = round(sum(confs) / len(confs) / 100, 3) if confs else 0.0
+                    lines.append(line)
+                backend, version = 'tesseract', str(pytesseract.get_tesseract_version())
+            
+            lines.sort(key=lambda line: (line[2], line[1]))
+            return {'backend': backend, 'version': version, 'lines': lines}
         except Exception as e:
             print(f"OCR识别失败: {e}")
             return None
     
+    @staticmethod
+    def result_text(result):
+        """结构化结果转为纯文本（每行一段）"""
+        return '\n'.join(line[0] for line in result['lines'])
+    
+    @staticmethod
+    def pack_result(result):
+        """压缩结构化结果用于存储"""
+        return zlib.compress(json.dumps(result, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+    
+    @staticmethod
+    def unpack_result(data):
+        """解压存储的结构化结果"""
+        return json.loads(zlib.decompress(data).decode('utf-8'))
+    
+    def parse_invoice_layout(self, result):
+        """结合文字位置解析发票信息
+        
+        先按位置把标签与其右侧或下方的值配对，配对成功的字段优先于纯文本解析结果。
+        """
+        if not result or not result['lines']:
+            return {}
+        
+        lines = result['lines']
+        pairs = []
+        paired_fields = set()
+        for label_pattern, prefixes, fields in self.LAYOUT_LABELS:
+            matches = [line for line in lines if re.match(rf'^\s*[（(]?\s*({label_pattern})', line[0])]
+            for line, prefix, field in zip(matches, prefixes, fields):
+                value = self._layout_value(lines, line, label_pattern)
+                if value:
+                    pairs.append(f'{prefix}：{value}')
+                    paired_fields.add(field)
+        
+        # “合计”行右侧依次为金额、税额
+        for line in lines:
+            if re.match(r'^\s*合\s*计\s*$', line[0]):
+                values = [v[0] for v in self._right_of(lines, line) if re.search(r'\d', v[0])]
+                for prefix, field, value in zip(('金额', '税额'), ('amount', 'tax_amount'), values):
+                    pairs.append(f'{prefix}：{value.strip()}')
+                    paired_fields.add(field)
+                break
+        
+        info = self._extract_fields(self.result_text(result))
+        layout_info = self._extract_fields('\n'.join(pairs))
+        info.update({field: value for field, value in layout_info.items() if field in paired_fields})
+        self._complete_amounts(info)
+        return info
+    
+    def _layout_value(self, lines, label_line, label_pattern):
+        """查找标签对应的值：同一行标签之后的文字，否则右侧最近的文字，否则正下方的文字"""
+        rest = re.sub(rf'^\s*[（(]?\s*({label_pattern})\s*[)）]?\s*[：:]?\s*', '', label_line[0], count=1)
+        if rest.strip():
+            return rest.strip()
+        
+        right = self._right_of(lines, label_line)
+        if right:
+            return right[0][0].strip()
+        
+        height = label_line[4] - label_line[2]
+        below = [
+            line for line in lines
+            if line[2] >= label_line[4] and line[2] - label_line[4] < height * 1.5
+            and min(line[3], label_line[3]) > max(line[1], label_line[1])
+        ]
+        return below[0][0].strip() if below else None
+    
+    @staticmethod
+    def _right_of(lines, label_line):
+        """与标签处于同一行（垂直方向重叠过半）且在其右侧的文字，按从左到右排列"""
+        height = label_line[4] - label_line[2]
+        result = []
+        for line in lines:
+            if line is label_line or line[1] < label_line[3] - height:
+                continue
+            overlap = min(line[4], label_line[4]) - max(line[2], label_line[2])
+            if overlap > min(height, line[4] - line[2]) / 2:
+                result.append(line)
+        return sorted(result, key=lambda line: line[1])
+    
     def parse_invoice_info(self, ocr_text):
         """解析OCR识别的文本，提取发票信息"""
         if not ocr_text:
             return {}
         
+        info = self._extract_fields(ocr_text)
+        self._complete_amounts(info)
+        return info
+    
+    def _extract_fields(self, ocr_text):
+        """按正则从文本中提取各字段"""
         info = {}
         lines = ocr_text.split('\n')
         full_text = ocr_text
@@ -325,6 +1882,11 @@ class InvoiceOCR:
                     pass
                 break
         
+        return info
+    
+    @staticmethod
+    def _complete_amounts(info):
+        """补全缺失的税额、合计"""
         # 如果没有识别到合计，尝试用金额+税额计算
         if 'total_amount' not in info and 'amount' in info and 'tax_amount' in info:
             info['total_amount'] = info['amount'] + info['tax_amount']
@@ -332,24 +1894,651 @@ class InvoiceOCR:
             # 假设税率为13%
             info['tax_amount'] = round(info['amount'] * 0.13, 2)
             info['total_amount'] = info['amount'] + info['tax_amount']
+
+
+def _process_rss_mb(pid):
+    """获取进程常驻内存（MB），无法获取时返回 None"""
+    if PSUTIL_AVAILABLE:
+        try:
+            return psutil.Process(pid).memory_info().rss / 1024 / 1024
+        except psutil.Error:
+            return None
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _ocr_worker_main(conn):
+    """OCR 工作进程入口：初始化引擎后循环处理图片路径，收到 None 时退出"""
+    ocr = InvoiceOCR()
+    conn.send(('ready', None))
+    while True:
+        try:
+            image_path = conn.recv()
+        except EOFError:
+            break
+        if image_path is None:
+            break
+        conn.send(('result', ocr.recognize_structured(image_path)))
+
+
+class _WorkerFailure(Exception):
+    """OCR 工作进程异常（超时、崩溃或超出内存上限）"""
+
+
+class _OCRWorker:
+    """OCR 工作进程句柄"""
+    
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_ocr_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.tasks = 0
+    
+    def stop(self, timeout=5):
+        """正常退出，超时则强制结束"""
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        self.kill()
+    
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class OCRSupervisor:
+    """OCR 工作进程监管类
+    
+    在独立进程中运行 OCR，限制单进程内存和单张图片耗时；进程处理一定数量
+    的图片或内存超过回收阈值后自动重建，崩溃后重启并重试该图片一次。
+    """
+    
+    # 等待工作进程期间检查内存和存活状态的间隔（秒）
+    CHECK_INTERVAL = 0.5
+    
+    def __init__(self, workers=2, max_tasks_per_worker=200, recycle_rss_mb=1500,
+                 memory_limit_mb=3000, task_timeout=120, startup_timeout=300):
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.recycle_rss_mb = recycle_rss_mb
+        self.memory_limit_mb = memory_limit_mb
+        self.task_timeout = task_timeout
+        self.startup_timeout = startup_timeout
+        # 使用 spawn 启动，避免在多线程进程中 fork
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self.metrics = {
+            'workers': workers,
+            'tasks': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'retries': 0,
+            'timeouts': 0,
+            'crashes': 0,
+            'memory_kills': 0,
+            'recycles': 0,
+            'restarts': 0,
+            'peak_rss_mb': 0.0
+        }
+        if _process_rss_mb(os.getpid()) is None:
+            print("警告: 无法获取进程内存（请安装 psutil），OCR 进程的内存上限和按内存回收均不生效", flush=True)
+        for _ in range(workers):
+            self._idle.put(_OCRWorker(self._context))
+    
+    def _count(self, name, value=1):
+        with self._lock:
+            self.metrics[name] += value
+    
+    def get_metrics(self):
+        """获取监管指标快照"""
+        with self._lock:
+            return dict(self.metrics)
+    
+    def recognize_structured(self, image_path):
+        """在工作进程中识别图片，返回结构化结果；失败时重建进程并重试一次，仍失败则抛出 RuntimeError"""
+        self._count('tasks')
+        for attempt in range(2):
+            worker = self._idle.get()
+            # 无论结果如何，都要放回一个工作进程（原进程或替换进程），否则进程池会被耗尽
+            replacement = worker
+            try:
+                result = self._run(worker, image_path)
+                
+                # 识别耗时短于检查间隔时 _wait 中不会采样，完成后补采一次
+                rss = self._sample_rss(worker)
+                if worker.tasks >= self.max_tasks_per_worker or (rss and rss > self.recycle_rss_mb):
+                    worker.stop()
+                    self._count('recycles')
+                    try:
+                        replacement = _OCRWorker(self._context)
+                    except Exception as e:
+                        # 放回已停止的进程，下次使用时按崩溃处理并重建
+                        print(f"OCR进程重建失败: {e}", flush=True)
+            except _WorkerFailure as e:
+                replacement = self._replace(worker)
+                if attempt == 0:
+                    self._count('retries')
+                    continue
+                self._count('failed')
+                raise RuntimeError(str(e))
+            except Exception:
+                # 其他异常（如结果无法反序列化）时进程状态未知，同样重建
+                replacement = self._replace(worker)
+                self._count('failed')
+                raise
+            finally:
+                self._idle.put(replacement)
+            
+            # 工作进程返回 None 表示识别失败
+            self._count('succeeded' if result is not None else 'failed')
+            return result
+    
+    def _replace(self, worker):
+        """结束异常的工作进程并启动新进程"""
+        worker.kill()
+        self._count('restarts')
+        return _OCRWorker(self._context)
+    
+    def _run(self, worker, image_path):
+        """向工作进程发送任务并监控直到返回结果"""
+        if not worker.ready:
+            self._wait(worker, self.startup_timeout, 'OCR引擎启动超时')
+            worker.ready = True
         
-        return info
+        try:
+            worker.conn.send(image_path)
+        except OSError:
+            self._count('crashes')
+            raise _WorkerFailure(f'OCR进程异常退出（退出码 {worker.process.exitcode}）')
+        
+        result = self._wait(worker, self.task_timeout, f'识别超时（超过 {self.task_timeout} 秒）')
+        worker.tasks += 1
+        return result
+    
+    def _wait(self, worker, timeout, timeout_message):
+        """等待工作进程消息，期间检查超时、崩溃和内存上限"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if worker.conn.poll(self.CHECK_INTERVAL):
+                    return worker.conn.recv()[1]
+            except (EOFError, OSError):
+                worker.process.join(1)
+                self._count('crashes')
+                raise _WorkerFailure(f'OCR进程异常退出（退出码 {worker.process.exitcode}）')
+            
+            if not worker.process.is_alive():
+                self._count('crashes')
+                raise _WorkerFailure(f'OCR进程异常退出（退出码 {worker.process.exitcode}）')
+            
+            rss = self._sample_rss(worker)
+            if rss and rss > self.memory_limit_mb:
+                self._count('memory_kills')
+                raise _WorkerFailure(f'OCR进程内存超出上限（{rss:.0f} MB > {self.memory_limit_mb} MB）')
+            
+            if time.monotonic() > deadline:
+                self._count('timeouts')
+                raise _WorkerFailure(timeout_message)
+    
+    def _sample_rss(self, worker):
+        """采样工作进程内存并更新峰值指标，无法获取时返回 None"""
+        rss = _process_rss_mb(worker.process.pid)
+        if rss:
+            with self._lock:
+                self.metrics['peak_rss_mb'] = max(self.metrics['peak_rss_mb'], round(rss, 1))
+        return rss
+    
+    def close(self):
+        """停止所有工作进程"""
+        for _ in range(self.metrics['workers']):
+            self._idle.get().stop()
+
+
+class IngestQueue:
+    """监控目录导入任务队列（持久化在 SQLite 中，崩溃后可恢复）"""
+    
+    def __init__(self, queue_path):
+        self.queue_path = queue_path
+        self.init_database()
+    
+    def init_database(self):
+        """初始化任务表"""
+        conn = sqlite3.connect(self.queue_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ingest_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_hash TEXT NOT NULL UNIQUE,
+                path TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                parsed TEXT,
+                ocr_result BLOB,
+                invoice_number TEXT,
+                reason TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 兼容旧版本创建的任务表
+        cursor.execute('PRAGMA table_info(ingest_jobs)')
+        if 'ocr_result' not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute('ALTER TABLE ingest_jobs ADD COLUMN ocr_result BLOB')
+        
+        conn.commit()
+        conn.close()
+    
+    def _execute(self, sql, params=()):
+        conn = sqlite3.connect(self.queue_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.execute(sql, params)
+            rows = cursor.fetchall()
+            conn.commit()
+            return rows
+        finally:
+            conn.close()
+    
+    def recover(self):
+        """将上次异常退出时处理中的任务恢复为待处理，返回恢复数量"""
+        conn = sqlite3.connect(self.queue_path)
+        cursor = conn.cursor()
+        cursor.execute("UPDATE ingest_jobs SET status = 'pending' WHERE status = 'running'")
+        count = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return count
+    
+    def get_by_hash(self, file_hash):
+        """按文件内容哈希查找任务"""
+        rows = self._execute('SELECT * FROM ingest_jobs WHERE file_hash = ?', (file_hash,))
+        return dict(rows[0]) if rows else None
+    
+    def enqueue(self, path, file_hash):
+        """登记新任务，返回任务 id"""
+        conn = sqlite3.connect(self.queue_path)
+        cursor = conn.cursor()
+        cursor.execute('INSERT INTO ingest_jobs (file_hash, path) VALUES (?, ?)', (file_hash, path))
+        job_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return job_id
+    
+    def requeue(self, job_id, path):
+        """将失败的任务重新置为待处理，清除上次的识别结果"""
+        self._execute(
+            "UPDATE ingest_jobs SET status = 'pending', path = ?, parsed = NULL, ocr_result = NULL, "
+            "invoice_number = NULL, reason = NULL, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (path, job_id)
+        )
+    
+    def claim_pending(self, limit):
+        """取出最多 limit 个待处理任务并标记为处理中"""
+        rows = self._execute(
+            "SELECT * FROM ingest_jobs WHERE status = 'pending' ORDER BY id LIMIT ?", (limit,)
+        )
+        for row in rows:
+            self._execute(
+                "UPDATE ingest_jobs SET status = 'running', attempts = attempts + 1, "
+                "updated_at = CURRENT_TIMESTAMP WHERE id = ?", (row['id'],)
+            )
+        return [dict(row) for row in rows]
+    
+    def update(self, job_id, **fields):
+        """更新任务字段"""
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        self._execute(
+            f'UPDATE ingest_jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+            tuple(fields.values()) + (job_id,)
+        )
+
+
+class FolderWatcher:
+    """目录监控类：Linux 下使用 inotify，其他平台或失败时轮询目录"""
+    
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    
+    def __init__(self, directory, poll_interval=5.0):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self._fd = None
+        self._last_scan = 0
+        
+        if sys.platform.startswith('linux'):
+            try:
+                self._init_inotify()
+            except (OSError, AttributeError) as e:
+                print(f"inotify 不可用，改为轮询目录: {e}")
+                self._fd = None
+    
+    def _init_inotify(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 失败')
+        wd = libc.inotify_add_watch(fd, os.fsencode(self.directory), self.IN_CLOSE_WRITE | self.IN_MOVED_TO)
+        if wd < 0:
+            os.close(fd)
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch 失败')
+        self._fd = fd
+    
+    @property
+    def using_inotify(self):
+        return self._fd is not None
+    
+    def poll(self, timeout):
+        """等待最多 timeout 秒，返回可能有变化的文件路径集合"""
+        paths = set()
+        
+        if self._fd is not None:
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+            if readable:
+                data = os.read(self._fd, 64 * 1024)
+                offset = 0
+                while offset < len(data):
+                    _, _, _, name_len = struct.unpack_from('iIII', data, offset)
+                    offset += 16
+                    name = data[offset:offset + name_len].rstrip(b'\0')
+                    offset += name_len
+                    if name:
+                        paths.add(os.path.join(self.directory, os.fsdecode(name)))
+        else:
+            time.sleep(timeout)
+        
+        # 定期全量扫描，兼顾网络共享目录（不产生 inotify 事件）及事件丢失的情况
+        if time.time() - self._last_scan >= self.poll_interval:
+            self._last_scan = time.time()
+            with os.scandir(self.directory) as entries:
+                paths.update(entry.path for entry in entries if entry.is_file())
+        
+        return paths
+    
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class IngestDaemon:
+    """监控目录自动导入：识别放入目录的发票图片并写入数据库
+    
+    处理成功的文件移入 done/，失败的移入 failed/ 并附带原因说明文件。
+    """
+    
+    IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff')
+    # 文件大小和修改时间保持不变超过该秒数，才认为已写入完成
+    DEBOUNCE_SECONDS = 2.0
+    # 导入所需的必填字段
+    REQUIRED_FIELDS = ('invoice_number', 'invoice_date', 'amount', 'total_amount')
+    
+    # 监管指标输出间隔（秒）
+    METRICS_INTERVAL = 60
+    # 监控循环出错（如网络共享暂时断开）后重试前的等待秒数
+    ERROR_RETRY_DELAY = 5.0
+    
+    def __init__(self, db, watch_dir, workers=2, poll_interval=5.0, supervisor_options=None):
+        self.db = db
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.done_dir = os.path.join(self.watch_dir, 'done')
+        self.failed_dir = os.path.join(self.watch_dir, 'failed')
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.queue = IngestQueue(os.path.join(self.watch_dir, '.ingest_jobs.db'))
+        self._candidates = {}
+        # 已登记任务的文件 -> (大小, 修改时间)，未变化时定期全量扫描不再重复计算哈希
+        self._registered = {}
+        # 启动时目录中已有的文件（用于区分“上次处理完未来得及移动”与重新放入）
+        self._startup_paths = set()
+        self.supervisor_options = supervisor_options or {}
+        self.supervisor = None
+        # 识别在工作进程中进行，本进程只负责解析文本
+        self.parser = InvoiceOCR(load_engine=False)
+        self._stop = threading.Event()
+    
+    def _log(self, message):
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+    
+    def stop(self):
+        """请求停止（当前任务处理完后退出）"""
+        self._stop.set()
+    
+    def run(self):
+        """运行监控循环，直到调用 stop() 或收到 Ctrl+C"""
+        os.makedirs(self.done_dir, exist_ok=True)
+        os.makedirs(self.failed_dir, exist_ok=True)
+        
+        recovered = self.queue.recover()
+        if recovered:
+            self._log(f"恢复 {recovered} 个未完成的任务")
+        
+        with os.scandir(self.watch_dir) as entries:
+            self._startup_paths = {entry.path for entry in entries if entry.is_file()}
+        watcher = FolderWatcher(self.watch_dir, self.poll_interval)
+        self._log(f"开始监控 {self.watch_dir}（{'inotify' if watcher.using_inotify else '轮询'}，"
+                  f"并发 {self.workers}）")
+        
+        self.supervisor = OCRSupervisor(workers=self.workers, **self.supervisor_options)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        running = set()
+        last_metrics = time.time()
+        try:
+            while not self._stop.is_set():
+                try:
+                    if time.time() - last_metrics >= self.METRICS_INTERVAL:
+                        last_metrics = time.time()
+                        self._log_metrics()
+                    for path in watcher.poll(0.5):
+                        if self._is_candidate(path) and path not in self._candidates:
+                            self._candidates[path] = None
+                    self._check_candidates()
+                    
+                    running = {f for f in running if not f.done()}
+                    # 只取出空闲并发数量的任务，其余留在持久化队列中
+                    for job in self.queue.claim_pending(self.workers - len(running)):
+                        running.add(executor.submit(self._process_job, job))
+                except Exception as e:
+                    # 网络共享断开、任务库被锁等通常是暂时的，记录后继续监控
+                    self._log(f"监控出错，{self.ERROR_RETRY_DELAY:g} 秒后重试: {e}")
+                    self._stop.wait(self.ERROR_RETRY_DELAY)
+        except KeyboardInterrupt:
+            self._log("收到中断信号，等待当前任务完成...")
+        finally:
+            executor.shutdown(wait=True)
+            watcher.close()
+            self.supervisor.close()
+            self._log_metrics()
+            self._log("监控已停止")
+    
+    def _log_metrics(self):
+        metrics = self.supervisor.get_metrics()
+        self._log('OCR指标: ' + ', '.join(f'{name}={value}' for name, value in metrics.items()))
+    
+    def _is_candidate(self, path):
+        return (os.path.dirname(path) == self.watch_dir
+                and os.path.splitext(path)[1].lower() in self.IMAGE_EXTENSIONS
+                and os.path.isfile(path))
+    
+    def _check_candidates(self):
+        """去抖动：文件稳定后计算哈希并登记任务"""
+        now = time.time()
+        for path, previous in list(self._candidates.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self._candidates[path]
+                self._registered.pop(path, None)
+                continue
+            
+            signature = (stat.st_size, stat.st_mtime)
+            if self._registered.get(path) == signature:
+                # 已登记、尚未处理完的文件
+                del self._candidates[path]
+                continue
+            if previous is None or previous[0] != signature:
+                self._candidates[path] = (signature, now)
+                continue
+            if now - previous[1] < self.DEBOUNCE_SECONDS:
+                continue
+            
+            del self._candidates[path]
+            # 先记录再登记：登记或处理过程中移走文件时会清除该记录
+            self._registered[path] = signature
+            try:
+                self._register(path)
+            except Exception as e:
+                self._registered.pop(path, None)
+                if isinstance(e, PermissionError):
+                    # 扫描仪等程序仍占用文件，下次扫描时重试
+                    self._log(f"暂时无法读取 {os.path.basename(path)}，稍后重试: {e}")
+                elif not isinstance(e, FileNotFoundError):
+                    self._log(f"登记失败 {os.path.basename(path)}: {e}")
+    
+    def _register(self, path):
+        """登记文件任务；已导入成功的文件直接归档，失败过的文件重新识别"""
+        file_hash = self._file_hash(path)
+        job = self.queue.get_by_hash(file_hash)
+        
+        if job is None:
+            self.queue.enqueue(path, file_hash)
+        elif job['status'] == 'done' and job['path'] == path and path in self._startup_paths:
+            # 上次处理完成但未来得及移动文件
+            self._move(path, True)
+        elif job['status'] == 'done':
+            self._move(path, False, f"重复文件，内容与 {os.path.basename(job['path'])} 已导入")
+        elif job['status'] == 'failed':
+            # 重新放入目录表示要重试（可能已修正了导致失败的问题）
+            self.queue.requeue(job['id'], path)
+            self._log(f"重新导入: {os.path.basename(path)}（已失败 {job['attempts']} 次，上次原因: {job['reason']}）")
+    
+    @staticmethod
+    def _file_hash(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def _process_job(self, job):
+        """处理单个任务：识别、解析、入库、移动文件"""
+        path = job['path']
+        name = os.path.basename(path)
+        try:
+            if job['parsed']:
+                # 崩溃前已完成识别，直接使用保存的解析结果
+                info = json.loads(job['parsed'])
+                ocr_result = InvoiceOCR.unpack_result(job['ocr_result']) if job['ocr_result'] else None
+            else:
+                ocr_result = self.supervisor.recognize_structured(path)
+                if not ocr_result or not ocr_result['lines']:
+                    raise ValueError('OCR识别失败')
+                info = self.parser.parse_invoice_layout(ocr_result)
+                self.queue.update(job['id'], parsed=json.dumps(info, ensure_ascii=False),
+                                  ocr_result=InvoiceOCR.pack_result(ocr_result))
+            
+            missing = [field for field in self.REQUIRED_FIELDS if field not in info]
+            if missing:
+                raise ValueError(f"缺少字段: {', '.join(missing)}")
+            
+            marker = f"自动导入: {name} ({job['file_hash'][:12]})"
+            invoice_data = dict(info, notes=marker)
+            if ocr_result:
+                ocr_result = dict(ocr_result, parsed=info)
+            if not self.db.add_invoice(invoice_data, ocr_result, path) and not self._already_imported(info['invoice_number'], marker):
+                raise ValueError(f"发票号码已存在: {info['invoice_number']}")
+            
+            self.queue.update(job['id'], status='done', invoice_number=info['invoice_number'], reason=None)
+            self._log(f"导入成功: {name} -> {info['invoice_number']}")
+            success, reason = True, None
+        except Exception as e:
+            reason = str(e)
+            self.queue.update(job['id'], status='failed', reason=reason)
+            self._log(f"导入失败: {name}: {reason}")
+            success = False
+        
+        try:
+            self._move(path, success, reason)
+        except OSError as e:
+            self._log(f"移动文件失败 {name}: {e}")
+    
+    def _already_imported(self, invoice_number, marker):
+        """判断重复的发票号码是否正是本任务在崩溃前写入的"""
+        return any(inv[1] == invoice_number and inv[12] == marker
+                   for inv in self.db.search_invoices(invoice_number))
+    
+    def _move(self, path, success, reason=None):
+        """将文件移入 done/ 或 failed/，失败时写入原因说明"""
+        target_dir = self.done_dir if success else self.failed_dir
+        base, ext = os.path.splitext(os.path.basename(path))
+        target = os.path.join(target_dir, base + ext)
+        suffix = 1
+        while os.path.exists(target):
+            suffix += 1
+            target = os.path.join(target_dir, f'{base}_{suffix}{ext}')
+        
+        if os.path.exists(path):
+            shutil.move(path, target)
+        # 移动失败时保留登记记录，避免文件被反复计算哈希、重新识别
+        self._registered.pop(path, None)
+        self._startup_paths.discard(path)
+        if not success:
+            with open(os.path.splitext(target)[0] + '.reason.txt', 'w', encoding='utf-8') as f:
+                f.write(reason or '未知原因')
+
+
+def _when_done(widget, future, callback):
+    """在界面线程中等待 Future 完成后调用 callback(future)（tkinter 不是线程安全的）"""
+    if future.done():
+        callback(future)
+    else:
+        widget.after(10, _when_done, widget, future, callback)
 
 
 class InvoiceManagerApp:
     """发票管理主应用"""
     
-    def __init__(self, root):
+    def __init__(self, root, db_path='invoices.db'):
         self.root = root
         self.root.title('发票管理系统 - 单机版')
         self.root.geometry('1200x700')
         
-        self.db = InvoiceDatabase()
+        self.db = InvoiceDatabase(db_path)
+        self.analytics = None
+        self.backup = InvoiceBackup(self.db)
+        self.preview_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        self.analytics_lock = threading.Lock()
+        schedule = self.backup.load_schedule()
+        self.auto_backup_var = tk.BooleanVar(value=bool(schedule and schedule.get('enabled')))
+        
+        # 自动归档已结账年度，保持热库小巧
+        try:
+            self.db.archive_closed_years()
+        except sqlite3.Error as e:
+            print(f"年度归档失败: {e}")
         
         self.create_menu()
         self.create_widgets()
         self.refresh_invoice_list()
         self.update_statistics()
+        
+        # 恢复上次的自动备份设置，距上次备份已超过间隔时立即补做
+        if self.auto_backup_var.get():
+            self.start_auto_backup()
     
     def create_menu(self):
         """创建菜单栏"""
@@ -360,9 +2549,25 @@ class InvoiceManagerApp:
         file_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label='文件', menu=file_menu)
         file_menu.add_command(label='导出数据', command=self.export_data)
+        file_menu.add_command(label='年度结转', command=self.rollover_year)
+        file_menu.add_separator()
+        file_menu.add_command(label='立即备份', command=self.backup_now)
+        file_menu.add_checkbutton(label='每日自动备份（保留7份）', variable=self.auto_backup_var,
+                                  command=self.toggle_auto_backup)
         file_menu.add_separator()
         file_menu.add_command(label='退出', command=self.root.quit)
         
+        # 统计菜单
+        stats_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label='统计', menu=stats_menu)
+        stats_menu.add_command(label='统计分析', command=self.show_analytics)
+        
+        # 工具菜单
+        tools_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label='工具', menu=tools_menu)
+        tools_menu.add_command(label='重新解析OCR结果', command=self.reparse_ocr_results)
+        tools_menu.add_command(label='清理无用原件', command=self.collect_attachment_garbage)
+        
         # 帮助菜单
         help_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label='帮助', menu=help_menu)
@@ -450,10 +2655,18 @@ class InvoiceManagerApp:
         if messagebox.askyesno('确认', '确定要删除选中的发票吗？'):
             item = self.tree.item(selected[0])
             invoice_id = item['values'][0]
-            self.db.delete_invoice(invoice_id)
-            self.refresh_invoice_list()
-            self.update_statistics()
-            messagebox.showinfo('成功', '发票已删除')
+            
+            def on_deleted(future):
+                if future.exception():
+                    messagebox.showerror('错误', f'删除失败: {str(future.exception())}')
+                    return
+                # 只移除对应行，无需重新读取整个列表
+                if self.tree.exists(selected[0]):
+                    self.tree.delete(selected[0])
+                self.update_statistics()
+                messagebox.showinfo('成功', '发票已删除')
+            
+            _when_done(self.root, self.db.delete_invoice_async(invoice_id), on_deleted)
     
     def view_invoice_detail(self, event):
         """查看发票详情"""
@@ -461,17 +2674,15 @@ class InvoiceManagerApp:
         if selected:
             item = self.tree.item(selected[0])
             invoice_id = item['values'][0]
-            invoices = self.db.get_all_invoices()
-            for inv in invoices:
-                if inv[0] == invoice_id:
-                    self.show_invoice_detail(inv)
-                    break
+            invoice = self.db.get_invoice(invoice_id)
+            if invoice:
+                self.show_invoice_detail(invoice)
     
     def show_invoice_detail(self, invoice):
         """显示发票详情窗口"""
         detail_window = tk.Toplevel(self.root)
         detail_window.title('发票详情')
-        detail_window.geometry('500x400')
+        detail_window.geometry('900x460')
         
         fields = [
             ('发票号码', invoice[1]),
@@ -495,6 +2706,52 @@ class InvoiceManagerApp:
             ttk.Label(detail_window, text=str(value)).grid(
                 row=i, column=1, sticky=tk.W, padx=10, pady=5
             )
+        
+        # 原件预览
+        preview_frame = ttk.LabelFrame(detail_window, text='发票原件')
+        preview_frame.grid(row=0, column=2, rowspan=len(fields), sticky=tk.NSEW, padx=10, pady=5)
+        detail_window.columnconfigure(2, weight=1)
+        
+        attachment = self.db.get_attachment(invoice[0])
+        if not attachment:
+            ttk.Label(preview_frame, text='未关联原件', foreground='gray').pack(expand=True)
+            return
+        
+        preview_label = ttk.Label(preview_frame, text='正在加载预览...', foreground='gray')
+        preview_label.pack(expand=True)
+        
+        path = self.db.attachments.file_path(attachment['file_hash'], attachment['ext'])
+        ttk.Button(preview_frame, text=f'打开原件 ({attachment["filename"]})',
+                   command=lambda: self.open_file(path)).pack(pady=5)
+        
+        def show_preview(future):
+            if not preview_label.winfo_exists():
+                return
+            data = None if future.exception() else future.result()
+            if not data:
+                preview_label.config(text='无法预览该文件，请打开原件查看')
+                return
+            photo = tk.PhotoImage(data=base64.b64encode(data))
+            # 保留引用，避免图片被回收
+            preview_label.image = photo
+            preview_label.config(image=photo, text='')
+        
+        # 缩略图在后台线程中读取或生成，不阻塞界面
+        future = self.preview_executor.submit(self.db.attachments.thumbnail, attachment['file_hash'], attachment['ext'])
+        _when_done(detail_window, future, show_preview)
+    
+    @staticmethod
+    def open_file(path):
+        """用系统默认程序打开文件"""
+        if not os.path.exists(path):
+            messagebox.showerror('错误', f'文件不存在: {path}')
+            return
+        if sys.platform.startswith('win'):
+            os.startfile(path)
+        elif sys.platform == 'darwin':
+            subprocess.Popen(['open', path])
+        else:
+            subprocess.Popen(['xdg-open', path])
     
     def search_invoices(self):
         """搜索发票"""
@@ -540,6 +2797,116 @@ class InvoiceManagerApp:
                  f'总税额: ¥{stats["total_tax"]:.2f}'
         )
     
+    def show_analytics(self):
+        """显示统计分析窗口"""
+        if not NUMPY_AVAILABLE:
+            messagebox.showwarning('提示', '统计分析功能需要安装 numpy (pip install -r requirements-analytics.txt)')
+            return
+        
+        # 快照在多次打开窗口之间复用，只做增量刷新
+        if self.analytics is None:
+            self.analytics = InvoiceAnalytics(self.db)
+        
+        window = tk.Toplevel(self.root)
+        window.title('统计分析')
+        window.geometry('800x500')
+        
+        filter_frame = ttk.Frame(window)
+        filter_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        group_names = [name for _, name in InvoiceAnalytics.GROUP_KEYS]
+        ttk.Label(filter_frame, text='分组:').pack(side=tk.LEFT, padx=2)
+        group_var = ttk.Combobox(filter_frame, width=8, values=group_names, state='readonly')
+        group_var.set(group_names[0])
+        group_var.pack(side=tk.LEFT, padx=2)
+        
+        ttk.Label(filter_frame, text='开始日期:').pack(side=tk.LEFT, padx=(10, 2))
+        date_from = ttk.Entry(filter_frame, width=11)
+        date_from.pack(side=tk.LEFT, padx=2)
+        
+        ttk.Label(filter_frame, text='结束日期:').pack(side=tk.LEFT, padx=(10, 2))
+        date_to = ttk.Entry(filter_frame, width=11)
+        date_to.pack(side=tk.LEFT, padx=2)
+        
+        ttk.Label(filter_frame, text='状态:').pack(side=tk.LEFT, padx=(10, 2))
+        status_var = ttk.Combobox(filter_frame, width=6, values=['全部', '正常', '作废', '红冲'], state='readonly')
+        status_var.set('全部')
+        status_var.pack(side=tk.LEFT, padx=2)
+        
+        ttk.Label(filter_frame, text='销售方:').pack(side=tk.LEFT, padx=(10, 2))
+        seller_keyword = ttk.Entry(filter_frame, width=12)
+        seller_keyword.pack(side=tk.LEFT, padx=2)
+        
+        columns = ('分组', '数量', '金额', '税额', '合计')
+        tree = ttk.Treeview(window, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=200 if col == '分组' else 120)
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        summary_label = ttk.Label(window, text='')
+        summary_label.pack(pady=5)
+        
+        def query(key, filters):
+            # 在后台线程中执行；快照被多个统计窗口共用，刷新和查询需串行
+            with self.analytics_lock:
+                start = time.perf_counter()
+                self.analytics.refresh()
+                refreshed = time.perf_counter()
+                results = self.analytics.group_by(key, **filters)
+                summary = self.analytics.summary(**filters)
+                finished = time.perf_counter()
+            return results, summary, refreshed - start, finished - refreshed
+        
+        def show_results(future):
+            if not window.winfo_exists():
+                return
+            query_button.config(state=tk.NORMAL)
+            if future.exception():
+                summary_label.config(text='')
+                if isinstance(future.exception(), ValueError):
+                    messagebox.showerror('错误', '日期格式应为 YYYY-MM-DD', parent=window)
+                else:
+                    messagebox.showerror('错误', f'统计失败: {str(future.exception())}', parent=window)
+                return
+            results, summary, refresh_seconds, query_seconds = future.result()
+            
+            for item in tree.get_children():
+                tree.delete(item)
+            for row in results:
+                tree.insert('', tk.END, values=(
+                    row['key'],
+                    row['count'],
+                    f'¥{row["amount"]:.2f}',
+                    f'¥{row["tax"]:.2f}',
+                    f'¥{row["total"]:.2f}'
+                ))
+            
+            summary_label.config(
+                text=f'发票数: {summary["total_count"]} | '
+                     f'合计: ¥{summary["total_amount"]:.2f} | '
+                     f'税额: ¥{summary["total_tax"]:.2f} | '
+                     f'刷新 {refresh_seconds * 1000:.1f} ms, 查询 {query_seconds * 1000:.1f} ms'
+            )
+        
+        def run_query():
+            filters = {
+                'date_from': date_from.get().strip() or None,
+                'date_to': date_to.get().strip() or None,
+                'status': None if status_var.get() == '全部' else status_var.get(),
+                'seller_keyword': seller_keyword.get().strip() or None
+            }
+            key = InvoiceAnalytics.GROUP_KEYS[group_names.index(group_var.get())][0]
+            # 首次加载大量发票需要数秒，在后台线程中进行，避免界面卡住
+            query_button.config(state=tk.DISABLED)
+            summary_label.config(text='正在统计...')
+            future = self.preview_executor.submit(query, key, filters)
+            _when_done(window, future, show_results)
+        
+        query_button = ttk.Button(filter_frame, text='查询', command=run_query)
+        query_button.pack(side=tk.LEFT, padx=10)
+        run_query()
+    
     def export_data(self):
         """导出数据"""
         filename = filedialog.asksaveasfilename(
@@ -548,7 +2915,7 @@ class InvoiceManagerApp:
         )
         
         if filename:
-            invoices = self.db.get_all_invoices()
+            invoices = self.db.get_all_invoices(include_archive=True)
             data = []
             for inv in invoices:
                 data.append({
@@ -572,6 +2939,142 @@ class InvoiceManagerApp:
             
             messagebox.showinfo('成功', f'数据已导出到: {filename}')
     
+    def reparse_ocr_results(self):
+        """用当前解析规则重新解析已保存的OCR结果，预览变化后可一键应用"""
+        parser = InvoiceOCR(load_engine=False)
+        self.root.config(cursor='watch')
+        self.root.update()
+        try:
+            start = time.perf_counter()
+            report = self.db.reparse_ocr_results(parser)
+            seconds = time.perf_counter() - start
+        finally:
+            self.root.config(cursor='')
+        
+        if not report:
+            messagebox.showinfo('提示', f'重新解析完成（{seconds:.2f} 秒），没有字段发生变化')
+            return
+        
+        window = tk.Toplevel(self.root)
+        window.title('重新解析OCR结果')
+        window.geometry('900x500')
+        
+        applicable = sum(1 for entry in report if entry['changes'])
+        ttk.Label(window, text=f'共 {len(report)} 张发票的字段发生变化，其中 {applicable} 张可以应用'
+                               f'（耗时 {seconds:.2f} 秒）').pack(pady=5)
+        
+        columns = ('ID', '发票号码', '字段', '当前值', '新值', '说明')
+        tree = ttk.Treeview(window, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=60 if col == 'ID' else 150)
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        for entry in report:
+            for field, (old, new) in entry['changes'].items():
+                tree.insert('', tk.END, values=(entry['id'], entry['invoice_number'], field, old, new, '将更新'))
+            note = '无原始解析结果，不自动更新' if entry['legacy'] else '已人工修改，保留'
+            for field, (old, new) in entry['kept'].items():
+                tree.insert('', tk.END, values=(entry['id'], entry['invoice_number'], field, old, new, note))
+        
+        def apply_changes():
+            try:
+                updated = self.db.apply_reparse(report)
+            except sqlite3.Error as e:
+                messagebox.showerror('错误', f'应用失败: {str(e)}', parent=window)
+                return
+            errors = [entry for entry in report if 'error' in entry]
+            # 字段被原地更新，统计快照需要重建（换成新快照，后台线程可能正在使用旧快照）
+            if self.analytics:
+                self.analytics = InvoiceAnalytics(self.db)
+            window.destroy()
+            self.refresh_invoice_list()
+            self.update_statistics()
+            message = f'已更新 {updated} 张发票'
+            if errors:
+                message += f'，{len(errors)} 张未更新：\n\n' + '\n'.join(
+                    f"{entry['invoice_number']}: {entry['error']}" for entry in errors[:10])
+            messagebox.showinfo('完成', message)
+        
+        button_frame = ttk.Frame(window)
+        button_frame.pack(pady=10)
+        ttk.Button(button_frame, text='应用修改', command=apply_changes).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text='关闭', command=window.destroy).pack(side=tk.LEFT, padx=5)
+    
+    def collect_attachment_garbage(self):
+        """清理附件目录中未被任何发票引用的原件"""
+        try:
+            removed = self.db.collect_attachment_garbage()
+        except (OSError, sqlite3.Error) as e:
+            messagebox.showerror('错误', f'清理失败: {str(e)}')
+            return
+        messagebox.showinfo('成功', f'已清理 {removed} 个无用原件')
+    
+    def rollover_year(self):
+        """年度结转：将本年度之前的发票归档到年度归档库"""
+        current_year = datetime.now().year
+        if not messagebox.askyesno('确认', f'确定要将 {current_year} 年之前的发票归档吗？\n'
+                                         f'归档后仍可搜索、统计和导出。'):
+            return
+        
+        try:
+            archived = self.db.archive_closed_years(before_year=current_year)
+        except sqlite3.Error as e:
+            messagebox.showerror('错误', f'归档失败: {str(e)}')
+            return
+        
+        self.refresh_invoice_list()
+        self.update_statistics()
+        
+        if archived:
+            detail = '\n'.join(f'{year} 年: {count} 张' for year, count in archived.items())
+            messagebox.showinfo('成功', f'年度结转完成\n\n{detail}\n\n归档目录: {self.db.archive_dir}')
+        else:
+            messagebox.showinfo('提示', '没有需要归档的发票')
+    
+    def backup_now(self):
+        """在后台线程中立即备份数据库"""
+        results = []
+        self.backup.start(callback=lambda result, error: results.append((result, error)), compress=True)
+        
+        def check_done():
+            # tkinter 不是线程安全的，由主线程轮询备份结果
+            if not results:
+                self.root.after(200, check_done)
+                return
+            result, error = results[0]
+            if error:
+                messagebox.showerror('错误', f'备份失败: {str(error)}')
+            else:
+                messagebox.showinfo(
+                    '成功',
+                    f'备份完成并已通过完整性校验\n\n'
+                    f'位置: {result["path"]}\n'
+                    f'大小: {result["bytes"] / 1024 / 1024:.1f} MB（另含 {result["attachments"]} 个原件）\n'
+                    f'耗时: {result["seconds"]:.1f} 秒 ({result["mb_per_s"]:.1f} MB/s)'
+                )
+        
+        check_done()
+    
+    def start_auto_backup(self):
+        """启动每日自动备份"""
+        self.backup.start_schedule(
+            interval_hours=24, keep=7, compress=True,
+            callback=lambda result, error: error and print(f"自动备份失败: {error}")
+        )
+    
+    def toggle_auto_backup(self):
+        """开启或关闭每日自动备份（设置会保存）"""
+        enabled = self.auto_backup_var.get()
+        try:
+            self.backup.save_schedule(enabled, interval_hours=24, keep=7, compress=True)
+        except OSError as e:
+            messagebox.showwarning('警告', f'自动备份设置保存失败，下次启动需重新开启: {str(e)}')
+        if enabled:
+            self.start_auto_backup()
+        else:
+            self.backup.stop_schedule()
+    
     def show_about(self):
         """显示关于信息"""
         messagebox.showinfo(
@@ -593,6 +3096,9 @@ class InvoiceDialog:
         self.dialog.geometry('500x600')
         self.dialog.transient(parent)
         self.dialog.grab_set()
+        # 后台保存期间不允许关闭对话框，否则保存结果（如发票号码重复）无法提示
+        self.saving = False
+        self.dialog.protocol('WM_DELETE_WINDOW', self.close)
         
         self.create_widgets()
         
@@ -675,8 +3181,12 @@ class InvoiceDialog:
         ocr_frame = ttk.Frame(frame)
         ocr_frame.grid(row=12, column=0, columnspan=2, pady=10)
         
+        ttk.Button(ocr_frame, text='📎 关联原件', command=self.choose_source).pack(side=tk.LEFT, padx=5)
+        
         if OCR_AVAILABLE:
             ttk.Button(ocr_frame, text='📷 OCR识别发票', command=self.ocr_recognize).pack(side=tk.LEFT, padx=5)
+            self.source_label = ttk.Label(ocr_frame, text='', foreground='gray', font=('Arial', 8))
+            self.source_label.pack(side=tk.LEFT, padx=5)
         else:
             ocr_info = ttk.Label(
                 ocr_frame, 
@@ -684,17 +3194,25 @@ class InvoiceDialog:
                 foreground='gray',
                 font=('Arial', 8)
             )
-            ocr_info.pack()
+            ocr_info.pack(side=tk.LEFT)
+            self.source_label = ttk.Label(ocr_frame, text='', foreground='gray', font=('Arial', 8))
+            self.source_label.pack(side=tk.LEFT, padx=5)
         
         # 按钮
         button_frame = ttk.Frame(frame)
         button_frame.grid(row=13, column=0, columnspan=2, pady=20)
         
-        ttk.Button(button_frame, text='保存', command=self.save_invoice).pack(side=tk.LEFT, padx=5)
-        ttk.Button(button_frame, text='取消', command=self.dialog.destroy).pack(side=tk.LEFT, padx=5)
+        self.save_button = ttk.Button(button_frame, text='保存', command=self.save_invoice)
+        self.save_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(button_frame, text='取消', command=self.close)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
         
         # 初始化OCR
         self.ocr_engine = InvoiceOCR() if OCR_AVAILABLE else None
+        # 已应用到表单的OCR结构化结果，随发票一起保存
+        self.ocr_result = None
+        # 发票原件路径，保存时存入附件目录
+        self.source_path = None
     
     def save_invoice(self):
         """保存发票"""
@@ -727,18 +3245,57 @@ class InvoiceDialog:
                 messagebox.showerror('错误', '金额必须大于0')
                 return
             
-            # 保存到数据库
-            if self.db.add_invoice(invoice_data):
-                messagebox.showinfo('成功', '发票已保存')
-                self.dialog.destroy()
-            else:
-                messagebox.showerror('错误', '发票号码已存在，请检查')
+            # 保存到数据库（后台写入，完成前禁用保存、取消按钮，防止重复提交或提前关闭）
+            def on_saved(future):
+                if not self.dialog.winfo_exists():
+                    return
+                self.set_saving(False)
+                if future.exception():
+                    messagebox.showerror('错误', f'保存失败: {str(future.exception())}')
+                elif future.result():
+                    messagebox.showinfo('成功', '发票已保存')
+                    self.dialog.destroy()
+                else:
+                    messagebox.showerror('错误', '发票号码已存在，请检查')
+            
+            future = self.db.add_invoice_async(invoice_data, self.ocr_result, self.source_path)
+            self.set_saving(True)
+            _when_done(self.dialog, future, on_saved)
         
         except ValueError:
             messagebox.showerror('错误', '请输入有效的数字')
         except Exception as e:
             messagebox.showerror('错误', f'保存失败: {str(e)}')
     
+    def set_saving(self, saving):
+        """保存期间禁用保存、取消按钮"""
+        self.saving = saving
+        state = tk.DISABLED if saving else tk.NORMAL
+        self.save_button.config(state=state)
+        self.cancel_button.config(state=state)
+    
+    def close(self):
+        """关闭对话框（保存完成前忽略）"""
+        if not self.saving:
+            self.dialog.destroy()
+    
+    def set_source(self, path):
+        """设置发票原件"""
+        self.source_path = path
+        self.source_label.config(text=f'原件: {os.path.basename(path)}')
+    
+    def choose_source(self):
+        """选择发票原件（图片或PDF）"""
+        path = filedialog.askopenfilename(
+            title='选择发票原件',
+            filetypes=[
+                ('发票原件', '*.jpg *.jpeg *.png *.bmp *.gif *.tif *.tiff *.pdf'),
+                ('所有文件', '*.*')
+            ]
+        )
+        if path:
+            self.set_source(path)
+    
     def ocr_recognize(self):
         """OCR识别发票图片"""
         if not self.ocr_engine:
@@ -769,15 +3326,16 @@ class InvoiceDialog:
         
         try:
             # 执行OCR识别
-            ocr_text = self.ocr_engine.recognize_image(image_path)
+            ocr_result = self.ocr_engine.recognize_structured(image_path)
             
-            if not ocr_text:
+            if not ocr_result or not ocr_result['lines']:
                 progress_window.destroy()
                 messagebox.showerror('错误', 'OCR识别失败，请检查图片质量或重试')
                 return
             
-            # 解析发票信息
-            invoice_info = self.ocr_engine.parse_invoice_info(ocr_text)
+            # 结合文字位置解析发票信息
+            ocr_text = self.ocr_engine.result_text(ocr_result)
+            invoice_info = self.ocr_engine.parse_invoice_layout(ocr_result)
             
             progress_window.destroy()
             
@@ -840,6 +3398,9 @@ class InvoiceDialog:
                     self.total_amount.delete(0, tk.END)
                     self.total_amount.insert(0, str(invoice_info['total_amount']))
                 
+                # 保存识别时的解析结果，重新解析时据此区分人工修改过的字段
+                self.ocr_result = dict(ocr_result, parsed=invoice_info)
+                self.set_source(image_path)
                 result_window.destroy()
                 messagebox.showinfo('成功', 'OCR识别结果已填入表单，请检查并完善信息')
             
@@ -851,12 +3412,118 @@ class InvoiceDialog:
             messagebox.showerror('错误', f'OCR识别失败: {str(e)}')
 
 
+def run_ocr_benchmark(image_dir, truth_path=None):
+    """对比默认 Paddle 推理与部署配置（ocr_config.json）的单张延迟、单核吞吐和字段准确率
+    
+    truth_path 为 {文件名: {字段: 正确值}} 格式的 JSON；未提供时以默认推理的结果为基准计算一致率。
+    """
+    images = sorted(
+        os.path.join(image_dir, name) for name in os.listdir(image_dir)
+        if os.path.splitext(name)[1].lower() in IngestDaemon.IMAGE_EXTENSIONS
+    )
+    if not images:
+        print(f'目录中没有图片: {image_dir}')
+        return
+    
+    truth = None
+    if truth_path:
+        with open(truth_path, 'r', encoding='utf-8') as f:
+            truth = json.load(f)
+    
+    baseline = None
+    for label, config in (('Paddle 默认', {}), ('部署配置', InvoiceOCR.load_config())):
+        ocr = InvoiceOCR(config=config)
+        if not ocr.ocr:
+            print(f'{label}: OCR引擎不可用，跳过')
+            continue
+        
+        # 预热（首次推理包含内存分配和图优化）
+        ocr.recognize_structured(images[0])
+        
+        latencies = []
+        parsed = {}
+        for path in images:
+            start = time.perf_counter()
+            result = ocr.recognize_structured(path)
+            latencies.append(time.perf_counter() - start)
+            parsed[os.path.basename(path)] = ocr.parse_invoice_layout(result) if result else {}
+        
+        reference = truth if truth is not None else baseline
+        accuracy = None
+        if reference is not None:
+            checked = correct = 0
+            for name, fields in reference.items():
+                for field, expected in fields.items():
+                    checked += 1
+                    actual = parsed.get(name, {}).get(field)
+                    if isinstance(expected, (int, float)) and isinstance(actual, (int, float)):
+                        correct += round(actual - expected, 2) == 0
+                    else:
+                        correct += actual == expected
+            accuracy = correct / checked if checked else None
+        if baseline is None:
+            baseline = parsed
+        
+        latencies.sort()
+        throughput = len(latencies) / sum(latencies)
+        threads = ocr.threads_used()
+        print(f'[{label}] engine={ocr.config["engine"]} quantized={ocr.config["quantized"]} '
+              f'provider={ocr.config["provider"]} threads={threads}')
+        print(f'  图片数: {len(latencies)}  平均延迟: {sum(latencies) / len(latencies) * 1000:.0f} ms  '
+              f'P50: {latencies[len(latencies) // 2] * 1000:.0f} ms  '
+              f'P95: {latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000:.0f} ms')
+        print(f'  吞吐: {throughput:.2f} 张/秒  单核吞吐: {throughput / threads:.3f} 张/秒/核')
+        if accuracy is not None:
+            print(f'  字段{"准确率" if truth is not None else "与默认推理一致率"}: {accuracy * 100:.1f}%')
+
+
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description='发票管理系统')
+    parser.add_argument('--watch', metavar='DIR', help='监控目录模式：自动识别并导入放入该目录的发票图片')
+    parser.add_argument('--workers', type=int, default=2, help='监控目录模式下的并发识别数（默认2）')
+    parser.add_argument('--db', default='invoices.db', help='数据库文件路径（默认 invoices.db）')
+    parser.add_argument('--ocr-timeout', type=int, default=120, help='单张图片识别超时秒数（默认120）')
+    parser.add_argument('--ocr-memory-limit', type=int, default=3000, help='OCR进程内存上限MB，超出即重启（默认3000）')
+    parser.add_argument('--ocr-recycle-rss', type=int, default=1500, help='OCR进程内存超过该值MB后回收重建（默认1500）')
+    parser.add_argument('--ocr-max-tasks', type=int, default=200, help='OCR进程处理该数量图片后回收重建（默认200）')
+    parser.add_argument('--ocr-benchmark', metavar='DIR', help='对比默认推理与 ocr_config.json 配置的识别速度和准确率')
+    parser.add_argument('--ocr-truth', metavar='FILE', help='基准测试的标注文件（JSON：{文件名: {字段: 值}}）')
+    parser.add_argument('--quantize-ocr-models', metavar='DIR', help='将目录中的识别模型 rec.onnx 量化为 int8')
+    args = parser.parse_args()
+    
+    if args.quantize_ocr_models:
+        for path in InvoiceOCR.quantize_models(args.quantize_ocr_models):
+            print(f'已生成: {path}')
+        return
+    
+    if args.ocr_benchmark:
+        run_ocr_benchmark(args.ocr_benchmark, args.ocr_truth)
+        return
+    
+    if args.watch:
+        if not OCR_AVAILABLE:
+            print('监控目录模式需要安装OCR库 (pip install paddleocr 或 pip install pytesseract pillow)')
+            sys.exit(1)
+        supervisor_options = {
+            'task_timeout': args.ocr_timeout,
+            'memory_limit_mb': args.ocr_memory_limit,
+            'recycle_rss_mb': args.ocr_recycle_rss,
+            'max_tasks_per_worker': args.ocr_max_tasks
+        }
+        db = InvoiceDatabase(args.db)
+        IngestDaemon(db, args.watch, workers=args.workers, supervisor_options=supervisor_options).run()
+        db.close()
+        return
+    
     root = tk.Tk()
-    app = InvoiceManagerApp(root)
+    app = InvoiceManagerApp(root, args.db)
     root.mainloop()
+    # 等待后台写入全部落盘
+    app.db.close()
 
 
 if __name__ == '__main__':
+    # 打包为 exe 后，OCR 工作进程需要此调用才能正常启动
+    multiprocessing.freeze_support()
     main()